@@ -1,14 +1,18 @@
 from OpenGL.GL import *
 from OpenGL.GLU import *
-from PyQt5.QtCore import Qt, QTimer, QPoint
 
 from core.enums import CameraState
 from core.matrix_util import Matrix3D, Matrix4D, Vector3D, Vector4D
 
 import math
 import time
+# keys with a meaning besides moving
+ZOOM_KEY = 67 # C
+
 class Camera:
-    def __init__(self, fps = 60):
+    def __init__(self, fps = 60, clock=time.time):
+        # clock is replaced by a simulated one when a flythrough is replayed
+        self.clock = clock
         self.pos = [25, 25, 25]
         self.yaw,self.pitch = 0.1,0.1
         self.fov = CameraState.DEFAULT.value
@@ -19,9 +23,12 @@ class Camera:
 
         self.active_keys={}
         self.key_press_time={}
-        self.last_moved = time.time()
+        self.last_moved = self.clock()
 
         self.move_ticks = 0
+        # state before the last step, frames between steps are drawn in between
+        self.prev_pos = list(self.pos)
+        self.prev_fov = self.fov
         # self.aspect_ratio = 1.0
         self.near_plane = 0.1
         self.far_plane = 1000.0
@@ -47,10 +54,13 @@ class Camera:
             return Vector3D(0, 1, 0)
         
         return cross.normalize()
-    def proj_matr(self, width, height):
+    def lerp_pos(self, alpha):
+        return [self.prev_pos[i] + (self.pos[i]-self.prev_pos[i])*alpha for i in range(3)]
+    def proj_matr(self, width, height, alpha=1.0):
         # FIXME: flip_y is not a good solution
         aspect = width / height
-        fov_rad = math.radians(self.fov)
+        fov = self.prev_fov + (self.fov-self.prev_fov)*alpha
+        fov_rad = math.radians(fov)
         f = 1.0 / math.tan(fov_rad / 2)
         return Matrix4D(
             f / aspect, 0, 0, 0,
@@ -59,7 +69,11 @@ class Camera:
             0, 0, -1.0, 0
         )
     
-    def view_matr(self):
+    def view_matr(self, alpha=1.0):
+        '''
+        alpha between 0 and 1 places the camera between the previous step and the last one
+        '''
+        pos = self.lerp_pos(alpha)
         dir,right,up=self.get_dir(),self.right_vec,self.up_vec
         rotate_matr=Matrix4D(
             right[0], right[1], right[2],0,
@@ -68,9 +82,9 @@ class Camera:
             0,0,0,1
         )
         translate_matr=Matrix4D(
-            1,0,0,-self.pos[0],
-            0,1,0,-self.pos[1],
-            0,0,1,-self.pos[2],
+            1,0,0,-pos[0],
+            0,1,0,-pos[1],
+            0,0,1,-pos[2],
             0,0,0,1
         )
         return rotate_matr @ translate_matr
@@ -90,7 +104,37 @@ class Camera:
     def set_key(self, key, is_pressed):
         self.active_keys[key] = is_pressed
         if is_pressed:
-            self.key_press_time[key] = time.time()
+            self.key_press_time[key] = self.clock()
+    def press(self, key, is_pressed):
+        '''
+        key event from the window (or a replayed one)
+        '''
+        self.set_key(key, is_pressed)
+        if key == ZOOM_KEY:
+            self.state = CameraState.ZOOM if is_pressed else CameraState.DEFAULT
+    def update(self):
+        '''
+        one step of the camera, called at a fixed rate
+        '''
+        if ZOOM_KEY in self.active_keys:
+            # FIXME - after you zoom in once, this function gets called indefinitely
+            self.zoom()
+        if self.state==CameraState.DEFAULT:
+            self.move()
+    def step(self):
+        '''
+        update() of the fixed timestep loop, keeps the state it started from
+        returns True if the camera moved
+        '''
+        self.prev_pos = list(self.pos)
+        self.prev_fov = self.fov
+        self.update()
+        return self.pos != self.prev_pos or self.fov != self.prev_fov
+    def is_still(self):
+        '''
+        no key held and the zoom has settled, steps would not change anything
+        '''
+        return not any(self.active_keys.values()) and abs(self.state.value-self.fov) <= 0.05
     def apply(self, width, height):
         '''
         DEPRECATED
@@ -135,15 +179,15 @@ class Camera:
             dir_matr=[dir_matr[i]-up_vec[i] for i in range(3)]
         # Acceleration function
         # FIXME - could be improved
-        t = time.time()-self.last_moved
+        t = self.clock()-self.last_moved
         if t > 2:
             self.move_ticks = 0
-            self.last_moved = time.time()
+            self.last_moved = self.clock()
         elif t>=1:
             self.move_ticks+=1
             if self.move_ticks>30:
                 self.move_ticks=30
-            self.last_moved = time.time()
+            self.last_moved = self.clock()
         speed = 0.01+(0.01*pow(self.move_ticks,2))
         if speed > 0.5: # speed cap
             speed = 0.5
@@ -0,0 +1,64 @@
+'''
+Scripted camera paths for benchmarks and recordings
+'''
+import math
+
+class CameraPath:
+    '''
+    keyframes (t, pos, yaw, pitch) sorted by t, the camera is moved
+    linearly between them, yaw and pitch are in degrees like in Camera
+    '''
+    def __init__(self, keyframes):
+        if not keyframes:
+            raise ValueError("A camera path needs at least one keyframe")
+        self.keyframes = sorted(keyframes, key=lambda k: k[0])
+
+    @property
+    def duration(self):
+        return self.keyframes[-1][0] - self.keyframes[0][0]
+
+    def at(self, t):
+        '''
+        (pos, yaw, pitch) at time t, clamped to the ends of the path
+        '''
+        keys = self.keyframes
+        if t <= keys[0][0]:
+            return list(keys[0][1]), keys[0][2], keys[0][3]
+        for (t0, p0, y0, pi0), (t1, p1, y1, pi1) in zip(keys, keys[1:]):
+            if t <= t1:
+                a = (t - t0) / (t1 - t0) if t1 > t0 else 1.0
+                pos = [p0[i] + (p1[i] - p0[i])*a for i in range(3)]
+                return pos, y0 + (y1 - y0)*a, pi0 + (pi1 - pi0)*a
+        return list(keys[-1][1]), keys[-1][2], keys[-1][3]
+
+    def apply(self, camera, t):
+        camera.pos, camera.yaw, camera.pitch = self.at(t)
+
+    @classmethod
+    def orbit(cls, radius=60, height=40, duration=10.0, steps=36):
+        '''
+        circle around the world center, looking at it
+        '''
+        pitch = -math.degrees(math.atan2(height, radius))
+        keys = []
+        for i in range(steps + 1):
+            a = 2*math.pi*i/steps
+            pos = (radius*math.sin(a), height, -radius*math.cos(a))
+            # Camera.get_dir points at (sin(yaw), -cos(yaw)), so this looks at the center
+            keys.append((duration*i/steps, pos, math.degrees(a) + 180, pitch))
+        return cls(keys)
+
+    @classmethod
+    def line(cls, length=200, height=15, duration=10.0):
+        '''
+        low flight straight across the world, along -z
+        '''
+        return cls([
+            (0.0, (0, height, length/2), 0.0, -10.0),
+            (duration, (0, height, -length/2), 0.0, -10.0),
+        ])
+
+PATHS = {
+    "orbit": CameraPath.orbit,
+    "line": CameraPath.line,
+}
@@ -0,0 +1,35 @@
+'''
+Per-chunk world data for worlds that are generated on demand
+'''
+from core.region_gen import regions_in
+from core.terrain_gen import get_y
+from core.object_gen import place_model
+from core.world_file import chunk_blocks
+
+class ProceduralSource:
+    '''
+    generates the blocks of any chunk independently of the others,
+    so an unbounded world can be built around the camera in any order
+    '''
+    def __init__(self, seed, obj_intensity=0.05, height_intensity=0.3):
+        self.seed = seed
+        self.obj_intensity = obj_intensity
+        self.height_intensity = height_intensity
+
+    def chunk_data(self, cx, cz):
+        '''
+        returns (y_data, rg_data, obj_data) dictionaries of a single chunk,
+        obj_data holds model ids
+        '''
+        blocks = chunk_blocks(cx, cz)
+        xs = [x for x, _ in blocks]
+        zs = [z for _, z in blocks]
+        regions = regions_in(self.seed, min(xs), min(zs), max(xs), max(zs))
+        y_data, rg_data, obj_data = {}, {}, {}
+        for x, z in blocks:
+            rg = regions[(x, z)]
+            y = get_y((x, z), self.seed, rg, self.height_intensity)
+            rg_data[(x, z)] = rg
+            y_data[(x, z)] = y
+            obj_data[(x, z)] = place_model(x, y, z, self.seed, rg, self.obj_intensity)
+        return y_data, rg_data, obj_data
@@ -0,0 +1,48 @@
+'''
+Fixed timestep accumulator
+
+    steps = loop.advance()
+    for _ in range(steps):
+        simulate(loop.step)
+    draw(loop.alpha)
+the simulation always moves in steps of the same length no matter how
+often advance() gets called, alpha is how far the clock is between the
+last step and the next one, for interpolating what is drawn
+'''
+import time
+
+class FixedStep:
+    def __init__(self, step, clock=time.perf_counter, max_steps=8):
+        self.step = step
+        self.clock = clock
+        # after a long stall the missed steps are dropped instead of all run at once
+        self.max_steps = max_steps
+        self.last = None
+        self.accumulator = 0.0
+        self.alpha = 0.0
+
+    def advance(self):
+        '''
+        returns the number of steps that are due since the last call
+        '''
+        now = self.clock()
+        if self.last is None:
+            self.last = now
+        self.accumulator += now - self.last
+        self.last = now
+        steps = int(self.accumulator // self.step)
+        if steps > self.max_steps:
+            steps = self.max_steps
+            self.accumulator = 0.0
+        else:
+            self.accumulator -= steps*self.step
+        self.alpha = self.accumulator / self.step
+        return steps
+
+    def reset(self):
+        '''
+        forgets the time that passed, call when resuming after being idle
+        '''
+        self.last = None
+        self.accumulator = 0.0
+        self.alpha = 0.0
@@ -0,0 +1,133 @@
+'''
+Camera flythrough recording and replay
+
+a flight is a json file with the start of the camera and either the input
+events of every step or hand written keyframes:
+    {"version": 1, "timestep": 0.00694, "seed": 1, "rings": 6,
+     "start": {"pos": [25, 25, 25], "yaw": 0.1, "pitch": 0.1, "fov": 60},
+     "steps": 900,
+     "events": [[step, "key", code, pressed], [step, "rotate", dx, dy], ...]}
+or
+    {..., "keyframes": [[t, [x, y, z], yaw, pitch], ...]}
+replays run the camera with a simulated clock at the fixed timestep, so the
+same flight always gives the same camera in every step
+'''
+from core.camera_path import CameraPath
+
+import hashlib
+import json
+
+FLIGHT_VERSION = 1
+
+class SimClock:
+    '''
+    stands in for time.time, only moves when advanced
+    '''
+    def __init__(self, start=0.0):
+        self.now = start
+    def __call__(self):
+        return self.now
+    def advance(self, dt):
+        self.now += dt
+
+def camera_state(camera):
+    return {'pos': list(camera.pos), 'yaw': camera.yaw, 'pitch': camera.pitch, 'fov': camera.fov}
+
+class FlightRecorder:
+    '''
+    collects the input events of the camera, call step() once per camera update
+    '''
+    def __init__(self, camera, timestep, seed=None, rings=None):
+        self.timestep = timestep
+        self.seed = seed
+        self.rings = rings
+        self.start = camera_state(camera)
+        self.steps = 0
+        self.events = []
+    def key(self, code, pressed):
+        self.events.append([self.steps, "key", code, bool(pressed)])
+    def rotate(self, dx, dy):
+        self.events.append([self.steps, "rotate", dx, dy])
+    def step(self):
+        self.steps += 1
+    def to_dict(self):
+        return {
+            'version': FLIGHT_VERSION,
+            'timestep': self.timestep,
+            'seed': self.seed,
+            'rings': self.rings,
+            'start': self.start,
+            'steps': self.steps,
+            'events': self.events,
+        }
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f)
+
+class Flight:
+    '''
+    a recorded or hand written flight, replay() moves a camera through it
+    '''
+    def __init__(self, data):
+        if data.get('version') != FLIGHT_VERSION:
+            raise ValueError(f"Unsupported flight version: {data.get('version')}")
+        self.data = data
+        self.timestep = data['timestep']
+        self.seed = data.get('seed')
+        self.rings = data.get('rings')
+        self.start = data.get('start')
+        self.path = None
+        self.events = {}
+        if 'keyframes' in data:
+            self.path = CameraPath([(t, tuple(pos), yaw, pitch) for t, pos, yaw, pitch in data['keyframes']])
+            self.steps = data.get('steps') or int(round(self.path.duration / self.timestep)) + 1
+        else:
+            self.steps = data['steps']
+            for event in data['events']:
+                self.events.setdefault(event[0], []).append(event[1:])
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            return cls(json.load(f))
+
+    def digest(self):
+        '''
+        short hash of the flight, benchmarks of different flights should not be compared
+        '''
+        return hashlib.sha1(json.dumps(self.data, sort_keys=True).encode()).hexdigest()[:12]
+
+    def reset(self, camera):
+        '''
+        puts the camera at the start of the flight, on a simulated clock
+        '''
+        camera.clock = SimClock()
+        camera.last_moved = camera.clock()
+        camera.active_keys = {}
+        camera.key_press_time = {}
+        camera.move_ticks = 0
+        if self.start is not None:
+            camera.pos = list(self.start['pos'])
+            camera.yaw = self.start['yaw']
+            camera.pitch = self.start['pitch']
+            camera.fov = self.start.get('fov', camera.fov)
+
+    def replay(self, camera):
+        '''
+        generator that advances the camera by one step per iteration,
+        yields (step, simulated time)
+        '''
+        self.reset(camera)
+        clock = camera.clock
+        for step in range(self.steps):
+            if self.path is not None:
+                self.path.apply(camera, clock())
+            else:
+                for kind, *args in self.events.get(step, ()):
+                    if kind == "key":
+                        camera.press(*args)
+                    elif kind == "rotate":
+                        camera.rotate(*args)
+                camera.update()
+            yield step, clock()
+            clock.advance(self.timestep)
@@ -0,0 +1,152 @@
+'''
+World generation pipeline
+
+input[seed; args] -> region generation -> height generation -> object generation
+'''
+from core.region_gen import init_regions
+from core.terrain_gen import init_heights
+from core.object_gen import init_objects
+from core.world_cache import WorldCache
+from core.tracing import span
+
+from collections import OrderedDict
+import threading
+
+STAGES = ("regions", "heights", "objects")
+# bump whenever a change makes the generators produce different worlds,
+# so stale worlds in the disk cache are not reused
+GENERATOR_VERSION = 1
+
+class GenerationCancelled(Exception):
+    '''
+    raised from a checkpoint when a newer generation replaces the current one
+    '''
+
+class StageCache:
+    '''
+    LRU cache of stage outputs
+
+    keys are tuples of the stage inputs, downstream keys contain the
+    upstream keys, so a stage is only reused if everything before it matches
+    '''
+    def __init__(self, max_entries=9):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+            self.misses += 1
+            return None
+
+    def __contains__(self, key):
+        with self.lock:
+            return key in self.entries
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+            }
+
+class GenerationPipeline:
+    '''
+    regions -> heights -> objects, with every stage memoized
+
+    changing obj_intensity reuses regions and heights,
+    changing height_intensity reuses regions
+    finished worlds also go to the disk cache, if there is one
+    '''
+    def __init__(self, max_entries=9, disk_cache=None):
+        self.cache = StageCache(max_entries)
+        self.disk_cache = disk_cache
+
+    def stage(self, key, build):
+        value = self.cache.get(key)
+        if value is None:
+            with span(f"stage_{key[0]}", "generation"):
+                value = build()
+            self.cache.put(key, value)
+        return value
+
+    def run(self, seed, rings, obj_intensity, height_intensity, progress=None, checkpoint=None):
+        '''
+        returns (rg_info, y_info, obj_info)
+        progress(stage, n_done, n_total) is called after every finished stage
+        checkpoint() is called inside the stages and may raise GenerationCancelled
+        '''
+        def report(stage):
+            if progress:
+                progress(stage, STAGES.index(stage)+1, len(STAGES))
+
+        rg_key = ("regions", seed, rings)
+        y_key = ("heights", height_intensity, rg_key)
+        obj_key = ("objects", obj_intensity, y_key)
+
+        disk_key = None
+        if self.disk_cache is not None and obj_key not in self.cache:
+            disk_key = self.disk_cache.key(seed, rings, obj_intensity, height_intensity, GENERATOR_VERSION)
+            with span("disk_cache_load", "generation"):
+                data = self.disk_cache.load(disk_key, rings)
+            if data is not None:
+                for key, value in zip((rg_key, y_key, obj_key), data):
+                    self.cache.put(key, value)
+                for stage in STAGES:
+                    report(stage)
+                return data
+
+        rg_info = self.stage(rg_key, lambda: init_regions(seed, rings, checkpoint=checkpoint))
+        report("regions")
+
+        y_info = self.stage(y_key, lambda: init_heights(seed, rings, height_intensity, rg_info, checkpoint=checkpoint))
+        report("heights")
+
+        obj_info = self.stage(obj_key, lambda: init_objects(seed, rings, obj_intensity, rg_info, y_info, checkpoint=checkpoint))
+        report("objects")
+
+        if disk_key is not None:
+            try:
+                self.disk_cache.store(disk_key, rings, rg_info, y_info, obj_info)
+            except OSError as e:
+                print('could not save world to the disk cache: ', e)
+        return rg_info, y_info, obj_info
+
+    def stats(self):
+        stats = self.cache.stats()
+        if self.disk_cache is not None:
+            disk = self.disk_cache.stats()
+            stats['disk_hits'] = disk['hits']
+            stats['disk_misses'] = disk['misses']
+        return stats
+
+default_pipeline = GenerationPipeline(disk_cache=WorldCache())
+
+def generate_world(seed, rings, obj_intensity, height_intensity, progress=None, checkpoint=None):
+    '''
+    runs all generation stages through the shared memoized pipeline
+    '''
+    return default_pipeline.run(
+        seed, rings, obj_intensity, height_intensity,
+        progress=progress, checkpoint=checkpoint
+    )
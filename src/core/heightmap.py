@@ -0,0 +1,134 @@
+'''
+External heightmaps
+
+heightmaps are memory mapped, so only the windows that chunks ask for are
+ever read from disk. Regions and objects are derived from the heights
+'''
+from core.enums import Region
+from core.object_gen import place_model
+from core.world_file import chunk_blocks
+
+import math
+import os
+import numpy as np
+
+# raw formats are square grids of little-endian values
+RAW_FORMATS = {
+    ".r16": "<u2",
+    ".raw": "<u2",
+    ".r32": "<f4",
+    ".f32": "<f4",
+}
+# uint16 heightmaps are mapped to 0..U16_RANGE
+U16_RANGE = 60.0
+
+# region thresholds, in world units
+FOREST_LEVEL = 24.0
+MOUNTAIN_LEVEL = 34.0
+SNOW_LEVEL = 42.0
+HILLY_SLOPE = 1.5 # largest height difference to a neighbouring block
+STEEP_SLOPE = 4.0
+FLAT_SLOPE = 1.0
+
+class Heightmap:
+    '''
+    grid of heights where data[i, j] is the block (i - origin_x, j - origin_z),
+    world height = value*scale + offset
+    '''
+    def __init__(self, data, scale=1.0, offset=0.0):
+        self.data = data
+        self.scale = scale
+        self.offset = offset
+        self.origin_x = data.shape[0] // 2
+        self.origin_z = data.shape[1] // 2
+
+    @classmethod
+    def open(cls, path, shape=None, dtype=None, scale=None, offset=0.0):
+        '''
+        memory maps a .npy file or a raw file, raw files are assumed to be
+        square unless shape is given, dtype is guessed from the extension
+        raw files whose size does not match the shape raise ValueError
+        '''
+        ext = os.path.splitext(path)[1].lower()
+        if ext == ".npy":
+            data = np.load(path, mmap_mode='r')
+        else:
+            dtype = np.dtype(dtype or RAW_FORMATS.get(ext, "<f4"))
+            size = os.path.getsize(path)
+            if shape is None:
+                side = math.isqrt(size // dtype.itemsize)
+                shape = (side, side)
+            if shape[0]*shape[1]*dtype.itemsize != size:
+                raise ValueError(
+                    f"{path} has {size} bytes, not {shape[0]}x{shape[1]} {dtype.name} values, "
+                    "pass the shape of non-square heightmaps"
+                )
+            data = np.memmap(path, dtype=dtype, mode='r', shape=shape)
+        if data.ndim != 2:
+            raise ValueError(f"{path} is not a 2D heightmap")
+        if scale is None:
+            scale = U16_RANGE / 65535 if data.dtype == np.uint16 else 1.0
+        return cls(data, scale, offset)
+
+    def max_rings(self):
+        '''
+        largest number of rings of a bounded world that fits into the heightmap
+        '''
+        half = min(self.origin_x, self.origin_z, self.data.shape[0]-1-self.origin_x, self.data.shape[1]-1-self.origin_z)
+        return max(1, (half + 4) // 6)
+
+    def window(self, x0, z0, x1, z1):
+        '''
+        heights of the blocks in [x0, x1] x [z0, z1] as a float32 array,
+        blocks outside the heightmap repeat its edge
+        '''
+        i = np.clip(np.arange(x0, x1+1) + self.origin_x, 0, self.data.shape[0]-1)
+        j = np.clip(np.arange(z0, z1+1) + self.origin_z, 0, self.data.shape[1]-1)
+        # only the rows and columns in [i.min(), i.max()] are read
+        block = np.asarray(self.data[i.min():i.max()+1, j.min():j.max()+1], dtype=np.float32)
+        block = block[np.ix_(i - i.min(), j - j.min())]
+        return block*self.scale + self.offset
+
+def region_from_height(y, slope):
+    if y >= SNOW_LEVEL and slope < FLAT_SLOPE:
+        return Region.SNOW_PLAINS
+    if y >= MOUNTAIN_LEVEL or slope >= STEEP_SLOPE:
+        return Region.MOUNTAINS
+    if slope >= HILLY_SLOPE:
+        return Region.HILLS
+    if y >= FOREST_LEVEL:
+        return Region.FOREST
+    return Region.STEPPE
+
+class HeightmapSource:
+    '''
+    chunk source for worlds built on an imported heightmap
+    '''
+    def __init__(self, heightmap, seed=1, obj_intensity=0.05):
+        self.heightmap = heightmap
+        self.seed = seed
+        self.obj_intensity = obj_intensity
+
+    def chunk_data(self, cx, cz):
+        '''
+        returns (y_data, rg_data, obj_data) dictionaries of a single chunk,
+        obj_data holds model ids
+        '''
+        blocks = chunk_blocks(cx, cz)
+        x0 = min(x for x, _ in blocks) - 1
+        z0 = min(z for _, z in blocks) - 1
+        x1 = max(x for x, _ in blocks) + 1
+        z1 = max(z for _, z in blocks) + 1
+        heights = self.heightmap.window(x0, z0, x1, z1)
+
+        y_data, rg_data, obj_data = {}, {}, {}
+        for x, z in blocks:
+            i, j = x - x0, z - z0
+            y = float(heights[i, j])
+            around = heights[i-1:i+2, j-1:j+2]
+            slope = float(np.abs(around - y).max())
+            rg = region_from_height(y, slope)
+            y_data[(x, z)] = y
+            rg_data[(x, z)] = rg
+            obj_data[(x, z)] = place_model(x, y, z, self.seed, rg, self.obj_intensity)
+        return y_data, rg_data, obj_data
@@ -42,6 +42,8 @@ except ImportError:
             MOUNTAINS = 3
             SNOW_PLAINS = 4
 
+from core.tracing import span, traced
+
 import math
 import random
 import os
@@ -57,11 +59,13 @@ class SimplexNoise:
         self.seed = seed
 
         # Initialize with seed for deterministic results.
-        random.seed(seed)
+        # A private generator gives the same table as random.seed(seed)
+        # without touching the global state, so threads can share it.
+        rng = random.Random(seed)
 
         # Generate permutation table.
         self.perm = list(range(256))
-        random.shuffle(self.perm)
+        rng.shuffle(self.perm)
         self.perm += self.perm  # Double for easier index wrapping.
 
         # Gradient vectors for 3D simplex noise.
@@ -142,11 +146,19 @@ class SimplexNoise:
 _simplex_noise = None
 
 def get_simplex_noise(seed):
-    """Get or create simplex noise instance with given seed."""
+    """
+    Get or create simplex noise instance with given seed.
+    The global is read once and the instance built here is returned, so a
+    generation of another seed on another thread can replace the shared
+    instance without this call ever handing out the wrong one.
+    """
     global _simplex_noise
-    if _simplex_noise is None or getattr(_simplex_noise, 'seed', None) != seed:
-        _simplex_noise = SimplexNoise(seed)
-    return _simplex_noise
+    noise = _simplex_noise
+    if noise is None or noise.seed != seed:
+        with span("simplex_noise", "generation", seed=seed):
+            noise = SimplexNoise(seed)
+        _simplex_noise = noise
+    return noise
 
 
 def can_place(coordinates, seed, region=Region.STEPPE, intensity=0.03):
@@ -219,71 +231,88 @@ def model_exists(path):
     """
     return os.path.isfile(path)
 
-def init_objects(seed, n_rings, intensity, rg_data, y_data):
+ASSETS_DIR = os.path.abspath(os.path.join(
+    os.path.dirname(__file__),
+    "..","..",
+    "static","assets"
+))
+# every model an object can have, the position in this tuple is the model id
+OBJECT_MODELS = ("bush.obj", "spruce.obj", "tree.obj", "rock.obj")
+
+def object_from_id(m_id, x, y, z):
+    """
+    Creates the object placed on the block (x, z) of height y from its model id.
+    Generated data only holds model ids, every world builds its own objects.
+    """
+    if m_id == 0:
+        return None
+    path = OBJECT_MODELS[m_id - 1]
+    try:
+        obj = Object3D(os.path.join(ASSETS_DIR, path))
+        obj.translate(x, y, z)
+        return obj
+    except Exception as e:
+        print(f"Error loading model {path}: {e}")
+        return None
+
+@traced("init_objects", "generation")
+def init_objects(seed, n_rings, intensity, rg_data, y_data, checkpoint=None):
     '''
     initializes objects for each block in a 3^n_rings sized world
-    returns them as a dictionary where for (x,z) => Object||None
+    returns them as a dictionary where for (x,z) => model id (0 for no object)
+    ids are plain ints, so cached stages can be shared by any number of worlds
+    checkpoint is called once per row, it may raise to abort generation
     '''
     border = (1 + ((n_rings-1)*3))*2
     obj_data = {}
     
-    # Default fallback model
-    fallback_model = "spruce.obj"
-    
     for x in range(-border, border+1, 1):
-        for z in range(-border, border+1, 1):
-            rg = rg_data[(x,z)]
-            y = y_data[(x,z)]
-            
-            if intensity == 0:
-                obj_data[(x,z)] = None
-                continue
-                
-            if can_place((x,y,z), seed, rg, intensity):
-                # Map regions to specific object models
-                match rg:
-                    case Region.STEPPE:
-                        path = "bush.obj"
-                    case Region.FOREST:
-                        path = "spruce.obj"
-                    case Region.HILLS:
-                        path = "tree.obj"
-                    case Region.MOUNTAINS:
-                        path = "rock.obj"
-                    case Region.SNOW_PLAINS:
-                        path = "spruce.obj"
-                    case _:
-                        path = fallback_model
-                
-                # Full path to the model file
-                full_path = os.path.abspath(os.path.join(
-                    os.path.dirname(__file__),
-                    "..","..", 
-                    "static","assets", path
-                ))
-                
-                # Check if the model exists, use fallback if not
-                if not model_exists(full_path):
-                    print(f"Warning: Model {path} not found, using fallback model")
-                    path = fallback_model
-                    full_path = os.path.abspath(os.path.join(
-                        os.path.dirname(__file__),
-                        "..","..", 
-                        "static","assets", path
-                    ))
-                
-                # Create the 3D object
-                try:
-                    obj_data[(x,z)] = Object3D(full_path)
-                    obj_data[(x,z)].translate(x, y, z)
-                except Exception as e:
-                    print(f"Error loading model {path}: {e}")
-                    obj_data[(x,z)] = None
-            else:
-                obj_data[(x,z)] = None
+        if checkpoint:
+            checkpoint()
+        with span("objects_row", "generation", x=x):
+            for z in range(-border, border+1, 1):
+                obj_data[(x,z)] = place_model(x, y_data[(x,z)], z, seed, rg_data[(x,z)], intensity)
                 
     return obj_data
 
+def place_model(x, y, z, seed, rg, intensity):
+    """
+    Returns the model id of the object of a single block, 0 if nothing grows there.
+    Only depends on the block itself, so it can be used for any block in any order.
+    """
+    # Default fallback model
+    fallback_model = "spruce.obj"
+
+    if intensity == 0:
+        return 0
+    if not can_place((x,y,z), seed, rg, intensity):
+        return 0
+
+    # Map regions to specific object models
+    match rg:
+        case Region.STEPPE:
+            path = "bush.obj"
+        case Region.FOREST:
+            path = "spruce.obj"
+        case Region.HILLS:
+            path = "tree.obj"
+        case Region.MOUNTAINS:
+            path = "rock.obj"
+        case Region.SNOW_PLAINS:
+            path = "spruce.obj"
+        case _:
+            path = fallback_model
+
+    # Full path to the model file
+    full_path = os.path.join(ASSETS_DIR, path)
+
+    # Check if the model exists, use fallback if not
+    if not model_exists(full_path):
+        print(f"Warning: Model {path} not found, using fallback model")
+        path = fallback_model
+
+    return OBJECT_MODELS.index(path) + 1
+
 
 def get_object_type(coordinates, seed, region=Region.STEPPE):
     """
@@ -1,16 +1,40 @@
 import math
 import random
+import threading
+from collections import OrderedDict
 def fade(t):
     return t * t * t * (t * (t * 6 - 15) + 10)
 
 def lerp(t, a, b):
     return a + t * (b - a)
 
+NOISE_CACHE_SIZE = 4 # a few seeds, e.g. a generated world next to a streamed one
+_noise_cache = OrderedDict() # seed => PerlinNoise, least recently used first
+_noise_lock = threading.Lock() # chunk data is generated on the worker threads
+
+def get_noise(seed):
+    '''
+    returns a shared PerlinNoise for the seed, building the table only once
+    '''
+    with _noise_lock:
+        noise = _noise_cache.get(seed)
+        if noise is not None:
+            _noise_cache.move_to_end(seed)
+            return noise
+    noise = PerlinNoise(seed)
+    with _noise_lock:
+        noise = _noise_cache.setdefault(seed, noise)
+        _noise_cache.move_to_end(seed)
+        while len(_noise_cache) > NOISE_CACHE_SIZE:
+            _noise_cache.popitem(last=False)
+    return noise
+
 class PerlinNoise:
     def __init__(self, seed=None):
-        random.seed(seed)
+        # same table as random.seed(seed) + random.shuffle, without touching the global generator
+        rng = random.Random(seed)
         self.p = list(range(256))
-        random.shuffle(self.p)
+        rng.shuffle(self.p)
         self.p += self.p
 
     def grad(self, hash, x, y, z):
@@ -1,14 +1,20 @@
 from math import floor
+from functools import lru_cache
 import random
 from core.enums import Region
 from core.perlin_noise import PerlinNoise
+from core.tracing import span, traced
 
-def init_regions(seed,n_rings):
+@traced("init_regions", "generation")
+def init_regions(seed,n_rings,checkpoint=None):
     '''
     initializes regions for each block in a 3^n_rings sized world
     returns them as a dictionary where for (x,z) => Region
+    checkpoint is called every now and then, it may raise to abort generation
     '''
-    random.seed(seed)
+    # private generator, same sequence as random.seed(seed) but a cancelled
+    # generation still running on another thread cannot disturb it
+    rng = random.Random(seed)
     border = (1 + ((n_rings-1)*3))*2
     directions = [
         (-1, 0),
@@ -26,46 +32,136 @@ def init_regions(seed,n_rings):
     q = []
     
     for _ in range(n_regions):
-        x, z = random.randint(-border, border), random.randint(-border, border)
-        rg_data[(x, z)] = Region(random.randint(0, 3))  
+        x, z = rng.randint(-border, border), rng.randint(-border, border)
+        rg_data[(x, z)] = Region(rng.randint(0, 3))  
         q.append((x, z))
 
-    while q:
-        cur_block = random.choice(q)
-        q.remove(cur_block)
-        cur_region = rg_data[cur_block]
-        for direction in directions:
-            nx = cur_block[0] + direction[0]
-            nz = cur_block[1] + direction[1]
-
-            if (-border <= nx <= border) and\
-               (-border <= nz <= border) and\
-               ((nx, nz) not in rg_data):
-                q.append((nx, nz))
-                rg_data[(nx, nz)] = cur_region
-    for (x, z) in rg_data: 
-        has_steppe = False
-        has_mountains = False
-
-        for direction in directions:
-            nx = x + direction[0]
-            nz = z + direction[1]
-
-            if (-border <= nx <= border) and (-border <= nz <= border):
-                neighbor_region = rg_data[(nx, nz)]
-
-                if neighbor_region == Region.STEPPE or neighbor_region == Region.SNOW_PLAINS:
-                    has_steppe = True
-                if neighbor_region == Region.MOUNTAINS:
-                    has_mountains = True
-
-                if has_steppe and has_mountains:
-                    rg_data[(x, z)] = Region.HILLS
-                    for direction2 in directions:
-                        nnx = x + direction2[0]
-                        nnz = z + direction2[1]
-                        if (-border <= nnx <= border) and (-border <= nnz <= border):
-                            rg_data[(nnx, nnz)] = Region.HILLS
-                    break
+    with span("growth", "generation", regions=n_regions):
+        steps = 0
+        while q:
+            steps += 1
+            if checkpoint and steps % 1024 == 0:
+                checkpoint()
+            cur_block = rng.choice(q)
+            q.remove(cur_block)
+            cur_region = rg_data[cur_block]
+            for direction in directions:
+                nx = cur_block[0] + direction[0]
+                nz = cur_block[1] + direction[1]
+
+                if (-border <= nx <= border) and\
+                   (-border <= nz <= border) and\
+                   ((nx, nz) not in rg_data):
+                    q.append((nx, nz))
+                    rg_data[(nx, nz)] = cur_region
+    if checkpoint:
+        checkpoint()
+    with span("hills", "generation"):
+        for (x, z) in rg_data: 
+            has_steppe = False
+            has_mountains = False
+
+            for direction in directions:
+                nx = x + direction[0]
+                nz = z + direction[1]
+
+                if (-border <= nx <= border) and (-border <= nz <= border):
+                    neighbor_region = rg_data[(nx, nz)]
+
+                    if neighbor_region == Region.STEPPE or neighbor_region == Region.SNOW_PLAINS:
+                        has_steppe = True
+                    if neighbor_region == Region.MOUNTAINS:
+                        has_mountains = True
+
+                    if has_steppe and has_mountains:
+                        rg_data[(x, z)] = Region.HILLS
+                        for direction2 in directions:
+                            nnx = x + direction2[0]
+                            nnz = z + direction2[1]
+                            if (-border <= nnx <= border) and (-border <= nnz <= border):
+                                rg_data[(nnx, nnz)] = Region.HILLS
+                        break
     return rg_data
 
+
+# size (in blocks) of the coarse grid cells that hold one region site each
+REGION_CELL = 48
+
+def cell_hash(*values):
+    '''
+    deterministic 64-bit hash of a few integers (splitmix-like mixing)
+    '''
+    h = 0x9E3779B97F4A7C15
+    for v in values:
+        h ^= v & 0xFFFFFFFFFFFFFFFF
+        h = (h * 0xBF58476D1CE4E5B9) & 0xFFFFFFFFFFFFFFFF
+        h ^= h >> 31
+    return h
+
+@lru_cache(maxsize=4096)
+def region_site(seed, i, j):
+    '''
+    returns (x, z, Region) of the region site inside the coarse cell (i, j)
+    '''
+    h = cell_hash(seed, i, j)
+    x = i*REGION_CELL + h % REGION_CELL
+    z = j*REGION_CELL + (h >> 16) % REGION_CELL
+    return x, z, Region((h >> 32) % 4)
+
+def base_region_at(seed, x, z):
+    '''
+    region of a block before the HILLS transition: the region of the closest site
+    '''
+    i, j = floor(x / REGION_CELL), floor(z / REGION_CELL)
+    best, best_d = None, None
+    for di in (-1, 0, 1):
+        for dj in (-1, 0, 1):
+            sx, sz, rg = region_site(seed, i+di, j+dj)
+            d = (sx-x)**2 + (sz-z)**2
+            if best_d is None or d < best_d:
+                best, best_d = rg, d
+    return best
+
+def regions_in(seed, x0, z0, x1, z1):
+    '''
+    regions of every block in [x0, x1] x [z0, z1] of an unbounded world,
+    returned as a dictionary where for (x,z) => Region
+
+    only needs the base regions of a 2 block halo around the area, so any
+    part of the world can be generated independently and in any order
+    the HILLS rule matches init_regions: a block that borders both
+    steppe (or snow plains) and mountains turns into hills together with
+    its neighbours
+    '''
+    halo = 2
+    base = {}
+    for x in range(x0-halo, x1+halo+1):
+        for z in range(z0-halo, z1+halo+1):
+            base[(x, z)] = base_region_at(seed, x, z)
+
+    directions = [
+        (-1, 0),
+        (-1, 1),
+        (0, 1),
+        (1, 1),
+        (1, 0),
+        (1, -1),
+        (0, -1),
+        (-1, -1)
+        ]
+    hills_centers = set()
+    for x in range(x0-1, x1+2):
+        for z in range(z0-1, z1+2):
+            neighbours = {base[(x+dx, z+dz)] for dx, dz in directions}
+            if (Region.STEPPE in neighbours or Region.SNOW_PLAINS in neighbours) \
+               and Region.MOUNTAINS in neighbours:
+                hills_centers.add((x, z))
+
+    rg_data = {}
+    for x in range(x0, x1+1):
+        for z in range(z0, z1+1):
+            if (x, z) in hills_centers or any((x+dx, z+dz) in hills_centers for dx, dz in directions):
+                rg_data[(x, z)] = Region.HILLS
+            else:
+                rg_data[(x, z)] = base[(x, z)]
+    return rg_data
@@ -1,13 +1,19 @@
 from core.region_gen import Region
-from core.perlin_noise import PerlinNoise
-def init_heights(seed,n_rings,intensity,rg_data):
+from core.perlin_noise import PerlinNoise, get_noise
+from core.tracing import traced
+
+@traced("init_heights", "generation")
+def init_heights(seed,n_rings,intensity,rg_data,checkpoint=None):
     '''
     initializes y-levels for each block in a 3^n_rings sized world
     returns them as a dictionary where for (x,z) => y
+    checkpoint is called once per row, it may raise to abort generation
     '''
     border = (1 + ((n_rings-1)*3))*2
     y_data = {}
     for x in range(-border,border+1,1):
+        if checkpoint:
+            checkpoint()
         for z in range(-border,border+1,1):
             rg = rg_data[(x,z)]
             y_data[(x,z)]=get_y((x,z),seed,rg,intensity)
@@ -49,7 +55,7 @@ def get_y(coordinates, seed, region, intensity=0.7):
 
 
          
-    noise_gen = PerlinNoise(seed)
+    noise_gen = get_noise(seed)
     x, z = coordinates
     y = noise_gen.noise(x * BASE_FREQUENCY, z * BASE_FREQUENCY) * BASE_AMPLITUDE
     y += noise_gen.noise(x * BASE_FREQUENCY * 2, z * BASE_FREQUENCY * 2) * (BASE_AMPLITUDE * PERSISTENCE)
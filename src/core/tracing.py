@@ -0,0 +1,134 @@
+'''
+Timeline tracing in the Chrome trace event format
+
+    with tracing.span("init_heights", rings=6):
+        ...
+
+    @tracing.traced("build_mesh")
+    def build_mesh(...):
+        ...
+
+spans are recorded with the process and thread ids, so the generation
+worker, the mesh workers and the GL thread show up as separate tracks.
+The file written by export() opens in https://ui.perfetto.dev or
+chrome://tracing. Tracing is off unless FSMT_TRACE=<file.json> is set
+(the trace is written on exit) or enable() is called; while it is off
+span() hands out a shared do-nothing context
+'''
+import atexit
+import functools
+import json
+import os
+import threading
+import time
+
+class NullSpan:
+    __slots__ = ()
+    def __enter__(self):
+        return self
+    def __exit__(self, *exc):
+        return False
+
+NULL_SPAN = NullSpan()
+
+class Span:
+    __slots__ = ("tracer", "name", "cat", "args", "start")
+    def __init__(self, tracer, name, cat, args):
+        self.tracer = tracer
+        self.name = name
+        self.cat = cat
+        self.args = args
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+    def __exit__(self, *exc):
+        self.tracer.record(self.name, self.cat, self.start, time.perf_counter(), self.args)
+        return False
+
+class Tracer:
+    def __init__(self):
+        self.enabled = False
+        self.events = []
+        self.threads = {} # tid => thread name
+        self.lock = threading.Lock()
+        self.origin = time.perf_counter()
+
+    def span(self, name, cat="", **args):
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, name, cat, args)
+
+    def record(self, name, cat, start, end, args=None):
+        thread = threading.current_thread()
+        event = {
+            'name': name,
+            'cat': cat,
+            'ph': 'X',
+            'ts': (start - self.origin)*1e6,
+            'dur': (end - start)*1e6,
+            'pid': os.getpid(),
+            'tid': thread.ident,
+        }
+        if args:
+            event['args'] = {key: str(value) if not isinstance(value, (int, float, bool)) else value for key, value in args.items()}
+        with self.lock:
+            self.events.append(event)
+            self.threads.setdefault(thread.ident, thread.name)
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def clear(self):
+        with self.lock:
+            self.events = []
+            self.threads = {}
+
+    def export(self, path):
+        with self.lock:
+            events = list(self.events)
+            threads = dict(self.threads)
+        pid = os.getpid()
+        # names for the thread tracks
+        meta = [
+            {'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': name}}
+            for tid, name in threads.items()
+        ]
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': meta + events, 'displayTimeUnit': 'ms'}, f)
+
+tracer = Tracer()
+
+def span(name, cat="", **args):
+    return tracer.span(name, cat, **args)
+
+def traced(name=None, cat=""):
+    '''
+    decorator, every call of the function becomes a span
+    '''
+    def decorator(func):
+        label = name or func.__qualname__
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not tracer.enabled:
+                return func(*args, **kwargs)
+            with Span(tracer, label, cat, None):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def enable():
+    tracer.enable()
+
+def disable():
+    tracer.disable()
+
+def export(path):
+    tracer.export(path)
+
+TRACE_PATH = os.environ.get("FSMT_TRACE")
+if TRACE_PATH:
+    tracer.enable()
+    atexit.register(lambda: tracer.export(TRACE_PATH))
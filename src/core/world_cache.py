@@ -0,0 +1,95 @@
+'''
+Persistent on-disk cache of generated worlds
+'''
+from core.world_data import to_grids, from_grids
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+import numpy as np
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "fsmt-gen", "worlds")
+GRIDS = ("regions", "heights", "objects")
+
+class WorldCache:
+    '''
+    stores the region, height and object grids of generated worlds
+
+    every world is a directory of .npy files named after the hash of its
+    generation parameters. Files are left uncompressed so they can be
+    memory mapped on load; the least recently used worlds are deleted
+    once the cache grows over max_bytes
+    '''
+    def __init__(self, path=DEFAULT_CACHE_DIR, max_bytes=256*1024*1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, seed, rings, obj_intensity, height_intensity, version):
+        params = json.dumps([seed, rings, obj_intensity, height_intensity, version])
+        return hashlib.sha1(params.encode()).hexdigest()
+
+    def entry_path(self, key):
+        return os.path.join(self.path, key)
+
+    def load(self, key, n_rings):
+        '''
+        returns (rg_info, y_info, obj_info) or None if the world is not cached
+        '''
+        entry = self.entry_path(key)
+        try:
+            grids = [np.load(os.path.join(entry, f"{name}.npy"), mmap_mode='r') for name in GRIDS]
+            data = from_grids(n_rings, *grids)
+        except (OSError, ValueError, IndexError):
+            with self.lock:
+                self.misses += 1
+            return None
+        # mtime is the "last used" time for eviction
+        os.utime(entry)
+        with self.lock:
+            self.hits += 1
+        return data
+
+    def store(self, key, n_rings, rg_info, y_info, obj_info):
+        entry = self.entry_path(key)
+        tmp = f"{entry}.tmp-{os.getpid()}-{threading.get_ident()}"
+        os.makedirs(tmp, exist_ok=True)
+        for name, grid in zip(GRIDS, to_grids(n_rings, rg_info, y_info, obj_info)):
+            np.save(os.path.join(tmp, f"{name}.npy"), grid)
+        with self.lock:
+            if os.path.isdir(entry):
+                shutil.rmtree(tmp, ignore_errors=True)
+            else:
+                os.replace(tmp, entry)
+            self.evict()
+
+    def entry_size(self, entry):
+        return sum(
+            os.path.getsize(os.path.join(entry, f))
+            for f in os.listdir(entry)
+        )
+
+    def evict(self):
+        '''
+        removes least recently used worlds until the cache fits into max_bytes
+        '''
+        entries = []
+        for name in os.listdir(self.path):
+            entry = os.path.join(self.path, name)
+            if os.path.isdir(entry) and '.tmp-' not in name:
+                entries.append((os.path.getmtime(entry), self.entry_size(entry), entry))
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        # the newest entry always stays
+        while total > self.max_bytes and len(entries) > 1:
+            _, size, entry = entries.pop(0)
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+
+    def stats(self):
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses}
@@ -0,0 +1,76 @@
+'''
+Conversion between the generation dictionaries and dense numpy grids
+
+grids are indexed as grid[x+border, z+border]
+'''
+from core.enums import Region
+
+from collections.abc import Mapping
+import numpy as np
+
+REGIONS = list(Region)
+
+def world_border(n_rings):
+    '''
+    largest |x| or |z| of a block in a world with n_rings rings
+    '''
+    return (1 + ((n_rings-1)*3))*2
+
+def to_grids(n_rings, rg_info, y_info, obj_info):
+    '''
+    returns (regions uint8, heights float32, objects uint8) grids,
+    objects are model ids (see object_gen.OBJECT_MODELS)
+    '''
+    border = world_border(n_rings)
+    size = 2*border+1
+    regions = np.zeros((size, size), dtype=np.uint8)
+    heights = np.zeros((size, size), dtype=np.float32)
+    objects = np.zeros((size, size), dtype=np.uint8)
+    for (x, z), rg in rg_info.items():
+        regions[x+border, z+border] = rg.value
+        heights[x+border, z+border] = y_info[(x, z)]
+        objects[x+border, z+border] = obj_info[(x, z)]
+    return regions, heights, objects
+
+class GridView(Mapping):
+    '''
+    read only (x, z) => value view of a grid, a cell is only read from the
+    (possibly memory mapped) array when it is looked up, so a cached world
+    costs nothing until its chunks get built
+    '''
+    def __init__(self, grid, border, convert):
+        self.grid = grid
+        self.border = border
+        self.convert = convert
+
+    def __getitem__(self, key):
+        x, z = key
+        i, j = x + self.border, z + self.border
+        if not (0 <= i < self.grid.shape[0] and 0 <= j < self.grid.shape[1]):
+            raise KeyError(key)
+        return self.convert(self.grid[i, j])
+
+    def __iter__(self):
+        b = self.border
+        for i in range(self.grid.shape[0]):
+            for j in range(self.grid.shape[1]):
+                yield (i - b, j - b)
+
+    def __len__(self):
+        return self.grid.size
+
+def from_grids(n_rings, regions, heights, objects):
+    '''
+    inverse of to_grids, returns (rg_info, y_info, obj_info) as lazy views
+    that read the grids block by block
+    '''
+    border = world_border(n_rings)
+    size = 2*border+1
+    for grid in (regions, heights, objects):
+        if grid.shape != (size, size):
+            raise ValueError(f"grid of shape {grid.shape} does not fit {n_rings} rings")
+    return (
+        GridView(regions, border, lambda v: REGIONS[v]),
+        GridView(heights, border, float),
+        GridView(objects, border, int),
+    )
@@ -0,0 +1,148 @@
+'''
+Binary world file format
+
+layout (little-endian):
+    header        magic, version, seed, rings, intensities, height quantization, chunk count
+    chunk index   one entry per chunk: center, offset, stored size, raw size, flags
+    chunk blocks  per chunk: 9 heights (uint16), 9 regions (uint8),
+                  object count (uint8) and (block, model id) uint8 pairs,
+                  optionally zlib compressed
+'''
+from core.enums import Region
+
+import mmap
+import struct
+import zlib
+import numpy as np
+
+MAGIC = b"FSMW"
+VERSION = 1
+
+HEADER = struct.Struct("<4sHHqiffffI")
+INDEX_ENTRY = struct.Struct("<iiQIIB3x")
+
+FLAG_ZLIB = 1
+
+BLOCK_SIZE = 2
+CHUNK_STEP = 6
+CHUNK_OFFSETS = [(dx, dz) for dx in (-1, 0, 1) for dz in (-1, 0, 1)]
+
+def chunk_centers(n_rings):
+    '''
+    centers of all chunks of a world, ring by ring from the middle outwards
+    '''
+    centers = [(0,0)]
+    for ring in range(1, n_rings):
+        r = CHUNK_STEP*ring
+        for x in range(-r,r+1,CHUNK_STEP):
+            centers.append((x, r))
+            centers.append((x, -r))
+        for z in range(-r+CHUNK_STEP,r-CHUNK_STEP+1,CHUNK_STEP):
+            centers.append((r, z))
+            centers.append((-r, z))
+    return centers
+
+def chunk_blocks(cx, cz):
+    return [(cx + dx*BLOCK_SIZE, cz + dz*BLOCK_SIZE) for dx, dz in CHUNK_OFFSETS]
+
+def save_world(path, seed, n_rings, obj_intensity, height_intensity, rg_info, y_info, obj_info, compress=True):
+    '''
+    writes the blocks used by the chunks of a world into a world file
+    '''
+    centers = chunk_centers(n_rings)
+    heights = [y_info[b] for c in centers for b in chunk_blocks(*c)]
+    h_min, h_max = min(heights), max(heights)
+    h_scale = (h_max - h_min) / 65535 or 1.0
+
+    blocks = []
+    index = []
+    offset = HEADER.size + INDEX_ENTRY.size*len(centers)
+    for cx, cz in centers:
+        coords = chunk_blocks(cx, cz)
+        q_heights = np.array(
+            [round((y_info[b] - h_min) / h_scale) for b in coords], dtype="<u2"
+        )
+        regions = np.array([rg_info[b].value for b in coords], dtype=np.uint8)
+        objects = [(i, obj_info[b]) for i, b in enumerate(coords) if obj_info[b]]
+        raw = q_heights.tobytes() + regions.tobytes() + bytes([len(objects)]) \
+            + bytes(v for pair in objects for v in pair)
+        flags = 0
+        stored = raw
+        if compress:
+            packed = zlib.compress(raw)
+            if len(packed) < len(raw):
+                stored, flags = packed, FLAG_ZLIB
+        index.append(INDEX_ENTRY.pack(cx, cz, offset, len(stored), len(raw), flags))
+        blocks.append(stored)
+        offset += len(stored)
+
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(
+            MAGIC, VERSION, 0, seed, n_rings, obj_intensity, height_intensity,
+            h_min, h_scale, len(centers)
+        ))
+        f.write(b"".join(index))
+        f.write(b"".join(blocks))
+
+class WorldFile:
+    '''
+    memory mapped world file, chunks are decoded only when they are asked for
+    '''
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "rb")
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, _, self.seed, self.n_rings, self.obj_intensity, self.height_intensity, \
+            self.h_min, self.h_scale, n_chunks = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a world file")
+        if version > VERSION:
+            raise ValueError(f"world file version {version} is not supported")
+
+        self.index = {}
+        for i in range(n_chunks):
+            cx, cz, offset, size, raw_size, flags = INDEX_ENTRY.unpack_from(
+                self.data, HEADER.size + i*INDEX_ENTRY.size
+            )
+            self.index[(cx, cz)] = (offset, size, raw_size, flags)
+
+    def has_chunk(self, cx, cz):
+        return (cx, cz) in self.index
+
+    def chunks_near(self, x, z, radius=None):
+        '''
+        chunk centers sorted by distance to (x, z), optionally only those within radius
+        '''
+        dist = lambda c: (c[0]-x)**2 + (c[1]-z)**2
+        centers = sorted(self.index, key=dist)
+        if radius is not None:
+            centers = [c for c in centers if dist(c) <= radius*radius]
+        return centers
+
+    def chunk_data(self, cx, cz):
+        '''
+        returns (y_data, rg_data, obj_data) dictionaries of a single chunk,
+        obj_data holds model ids
+        '''
+        offset, size, raw_size, flags = self.index[(cx, cz)]
+        raw = self.data[offset:offset+size]
+        if flags & FLAG_ZLIB:
+            raw = zlib.decompress(raw, bufsize=raw_size)
+        n = len(CHUNK_OFFSETS)
+        q_heights = np.frombuffer(raw, dtype="<u2", count=n)
+        regions = raw[2*n:3*n]
+        n_objects = raw[3*n]
+        models = {raw[3*n+1+2*i]: raw[3*n+2+2*i] for i in range(n_objects)}
+
+        y_data, rg_data, obj_data = {}, {}, {}
+        for i, (x, z) in enumerate(chunk_blocks(cx, cz)):
+            y = self.h_min + float(q_heights[i])*self.h_scale
+            y_data[(x, z)] = y
+            rg_data[(x, z)] = Region(regions[i])
+            obj_data[(x, z)] = models.get(i, 0)
+        return y_data, rg_data, obj_data
+
+    def close(self):
+        self.data.close()
+        self.file.close()
@@ -0,0 +1,147 @@
+'''
+Struct-of-arrays storage for terrain blocks
+'''
+from core.enums import Region
+
+import threading
+import numpy as np
+
+# flags
+FINAL = 1 # the block finished rising
+ALIVE = 2 # the slot belongs to a chunk
+
+RISE_DEPTH = 5 # blocks start this far below their height
+RISE_SPEED = 0.012 # done after (RISE_DEPTH/RISE_SPEED)**0.2 ~ 3.3s
+
+def rise_offset(t):
+    '''
+    how far a block is still below its height t seconds after it was created,
+    only depends on t so the animation does not care how often it is updated
+    works on floats and numpy arrays
+    '''
+    return np.maximum(RISE_DEPTH - RISE_SPEED*np.maximum(t, 0)**5, 0)
+REGIONS = list(Region)
+
+class BlockStore:
+    '''
+    every block is an index into parallel numpy arrays,
+    chunks own contiguous index ranges [start, stop)
+    '''
+    __slots__ = (
+        "capacity", "size", "free_ranges", "lock",
+        "center_x", "center_z", "y", "curr_y", "region", "obj", "time_created", "flags",
+        "objects", "free_objects", "max_y",
+    )
+    # bytes per block over all arrays, for memory accounting
+    BYTES_PER_BLOCK = 4+4+4+4+1+4+8+1
+
+    def __init__(self, capacity=1024):
+        self.capacity = 0
+        self.size = 0
+        self.free_ranges = {} # length => [start, ...]
+        self.lock = threading.Lock()
+        self.center_x = np.zeros(0, dtype=np.int32)
+        self.center_z = np.zeros(0, dtype=np.int32)
+        self.y = np.zeros(0, dtype=np.float32)
+        self.curr_y = np.zeros(0, dtype=np.float32)
+        self.region = np.zeros(0, dtype=np.uint8)
+        self.obj = np.zeros(0, dtype=np.int32) # index into objects, -1 for none
+        self.time_created = np.zeros(0, dtype=np.float64)
+        self.flags = np.zeros(0, dtype=np.uint8)
+        self.objects = []
+        self.free_objects = []
+        self.max_y = 0.0 # highest block ever added, picking stops above it
+        self.grow(capacity)
+
+    def grow(self, capacity):
+        for name in ("center_x", "center_z", "y", "curr_y", "region", "obj", "time_created", "flags"):
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+        self.capacity = capacity
+
+    def add(self, xs, zs, ys, regions, objs, now):
+        '''
+        stores a run of blocks and returns its (start, stop) range
+        '''
+        n = len(xs)
+        with self.lock:
+            starts = self.free_ranges.get(n)
+            if starts:
+                start = starts.pop()
+            else:
+                if self.size + n > self.capacity:
+                    self.grow(max(2*self.capacity, self.size + n))
+                start = self.size
+                self.size += n
+            stop = start + n
+            self.center_x[start:stop] = xs
+            self.center_z[start:stop] = zs
+            self.y[start:stop] = ys
+            self.max_y = max(self.max_y, float(max(ys)))
+            self.curr_y[start:stop] = np.asarray(ys, dtype=np.float32) - RISE_DEPTH
+            self.region[start:stop] = [rg.value for rg in regions]
+            ids = []
+            for obj in objs:
+                if obj is None:
+                    ids.append(-1)
+                elif self.free_objects:
+                    ids.append(self.free_objects.pop())
+                    self.objects[ids[-1]] = obj
+                else:
+                    ids.append(len(self.objects))
+                    self.objects.append(obj)
+            self.obj[start:stop] = ids
+            self.time_created[start:stop] = now
+            self.flags[start:stop] = ALIVE
+        return start, stop
+
+    def remove(self, start, stop):
+        '''
+        frees a range, it is reused by the next run of the same length
+        '''
+        with self.lock:
+            for i in self.obj[start:stop]:
+                if i >= 0:
+                    self.objects[i] = None
+                    self.free_objects.append(int(i))
+            self.obj[start:stop] = -1
+            self.flags[start:stop] = 0
+            self.free_ranges.setdefault(stop - start, []).append(start)
+
+    def snapshot(self, start, stop):
+        '''
+        copies of a range, taken under the lock so grow() can not swap the
+        arrays while they are read
+        returns (center_x, center_z, y, time_created, region, objects)
+        '''
+        with self.lock:
+            objects = [self.objects[o] if o >= 0 else None for o in self.obj[start:stop]]
+            return (
+                self.center_x[start:stop].copy(), self.center_z[start:stop].copy(),
+                self.y[start:stop].copy(), self.time_created[start:stop].copy(),
+                self.region[start:stop].copy(), objects,
+            )
+
+    def get_object(self, i):
+        o = self.obj[i]
+        return self.objects[o] if o >= 0 else None
+
+    def get_region(self, i):
+        return REGIONS[self.region[i]]
+
+    def update(self, now):
+        '''
+        eases every block that is still rising towards its height
+        '''
+        n = self.size
+        rising = np.nonzero((self.flags[:n] & (ALIVE | FINAL)) == ALIVE)[0]
+        if len(rising) == 0:
+            return
+        offset = rise_offset(now - self.time_created[rising])
+        self.curr_y[rising] = self.y[rising] - offset
+        self.flags[rising[offset <= 0]] |= FINAL
+
+    def all_final(self, start, stop):
+        return bool(np.all(self.flags[start:stop] & FINAL))
@@ -0,0 +1,168 @@
+'''
+Per-phase frame timing
+
+    with profiler.phase("draw"):
+        ...
+times every phase of a frame, keeps the last frames for rolling statistics
+and a longer log that can be exported as csv or json. A disabled profiler
+hands out a shared do-nothing context, so leaving the calls in costs
+a method call per phase
+'''
+from collections import deque
+
+import csv
+import json
+import time
+import numpy as np
+
+# phases in the order they happen in a frame
+PHASES = ("camera", "perf_tick", "rebuild", "upload", "draw", "swap")
+
+class NullPhase:
+    __slots__ = ()
+    def __enter__(self):
+        return self
+    def __exit__(self, *exc):
+        return False
+
+NULL_PHASE = NullPhase()
+
+class Phase:
+    __slots__ = ("profiler", "name", "start")
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+    def __exit__(self, *exc):
+        self.profiler.add(self.name, time.perf_counter() - self.start)
+        return False
+
+class FrameProfiler:
+    '''
+    frames are closed by next_frame(), phases that span callbacks
+    (like waiting for the swap) can use start() and stop()
+    '''
+    def __init__(self, enabled=False, history=600, max_log=100000):
+        self.enabled = enabled
+        self.history = deque(maxlen=history) # (frame, {phase: ms}) of the last frames
+        self.log = deque(maxlen=max_log) # same, for exporting
+        self.frame = 0
+        self.current = {}
+        self.started = {}
+
+    def phase(self, name):
+        if not self.enabled:
+            return NULL_PHASE
+        return Phase(self, name)
+
+    def start(self, name):
+        if self.enabled:
+            self.started[name] = time.perf_counter()
+
+    def stop(self, name):
+        start = self.started.pop(name, None)
+        if start is not None:
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name, seconds):
+        '''
+        adds to the time of a phase in the current frame, also used for times
+        measured elsewhere (like GPU timer queries)
+        '''
+        if not self.enabled:
+            return
+        self.current[name] = self.current.get(name, 0.0) + seconds*1000
+
+    def next_frame(self):
+        if not self.enabled or not self.current:
+            return
+        self.frame += 1
+        entry = (self.frame, self.current)
+        self.history.append(entry)
+        self.log.append(entry)
+        self.current = {}
+
+    def reset(self):
+        self.history.clear()
+        self.log.clear()
+        self.frame = 0
+        self.current = {}
+        self.started = {}
+
+    def set_enabled(self, enabled):
+        self.enabled = enabled
+        self.current = {}
+        self.started = {}
+
+    def phases(self, frames=None):
+        '''
+        known phases first, then the others in the order they showed up
+        '''
+        names = list(PHASES)
+        for _, times in (self.log if frames is None else frames):
+            for name in times:
+                if name not in names:
+                    names.append(name)
+        return names
+
+    def values(self, name):
+        return np.array([times.get(name, 0.0) for _, times in self.history], dtype=np.float64)
+
+    def histogram(self, name, bins=20):
+        '''
+        (counts, bin edges in ms) of a phase over the rolling window
+        '''
+        return np.histogram(self.values(name), bins=bins)
+
+    def stats(self):
+        '''
+        {phase: {mean_ms, p50_ms, p95_ms, max_ms}} over the rolling window
+        '''
+        stats = {}
+        if not self.history:
+            return stats
+        for name in self.phases(self.history):
+            v = self.values(name)
+            p50, p95 = np.percentile(v, (50, 95))
+            stats[name] = {'mean_ms': float(v.mean()), 'p50_ms': float(p50), 'p95_ms': float(p95), 'max_ms': float(v.max())}
+        return stats
+
+    def overlay_text(self):
+        lines = [f"{'phase':<14}{'avg':>7}{'p95':>7}{'max':>7}"]
+        cpu = gpu = 0.0
+        for name, s in self.stats().items():
+            # gpu_ phases come from timer queries and overlap the CPU ones
+            if name.startswith("gpu_"):
+                gpu += s['mean_ms']
+            else:
+                cpu += s['mean_ms']
+            lines.append(f"{name:<14}{s['mean_ms']:>7.2f}{s['p95_ms']:>7.2f}{s['max_ms']:>7.2f}")
+        lines.append(f"{'cpu total':<14}{cpu:>7.2f}")
+        if gpu:
+            lines.append(f"{'gpu total':<14}{gpu:>7.2f}")
+            lines.append("gpu bound" if gpu > cpu else "cpu bound")
+        return "\n".join(lines)
+
+    def export(self, path):
+        '''
+        writes the log as csv (one row per frame) or json, picked by the extension
+        '''
+        names = self.phases()
+        if path.lower().endswith(".json"):
+            with open(path, 'w') as f:
+                json.dump({
+                    'phases': names,
+                    'frames': [{'frame': frame, **times} for frame, times in self.log],
+                    'stats': self.stats(),
+                }, f, indent=1)
+            return
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(["frame"] + [f"{name}_ms" for name in names])
+            for frame, times in self.log:
+                writer.writerow([frame] + [f"{times.get(name, 0.0):.4f}" for name in names])
+
+# shared by worlds that nobody profiles
+null_profiler = FrameProfiler(enabled=False)
@@ -0,0 +1,85 @@
+'''
+GPU time of render passes
+
+every pass is wrapped in a GL_TIME_ELAPSED query, the queries of a frame
+are read FRAMES_IN_FLIGHT frames later when the GPU is long done with them,
+so reading them never waits. The times are added to the frame profiler as
+gpu_<pass>, next to the CPU phases
+'''
+from render.frame_profiler import NULL_PHASE
+
+from OpenGL.GL import *
+from OpenGL.raw.GL.VERSION.GL_3_3 import glGetQueryObjectui64v as raw_query_ui64
+
+import ctypes
+
+FRAMES_IN_FLIGHT = 3
+
+def query_result(query):
+    '''
+    64 bit result of a query (time in ns), PyOpenGL has no numpy type for
+    GL_UNSIGNED_INT64 so the wrapped glGetQueryObjectui64v cannot be used
+    '''
+    result = ctypes.c_uint64()
+    raw_query_ui64(query, GL_QUERY_RESULT, ctypes.byref(result))
+    return result.value
+
+class GpuPass:
+    __slots__ = ("query",)
+    def __init__(self, query):
+        self.query = query
+    def __enter__(self):
+        glBeginQuery(GL_TIME_ELAPSED, self.query)
+        return self
+    def __exit__(self, *exc):
+        glEndQuery(GL_TIME_ELAPSED)
+        return False
+
+class GpuTimers:
+    '''
+    pool of FRAMES_IN_FLIGHT sets of queries, one query per pass name in each set
+    passes must not overlap, GL only has one time elapsed query running at a time
+    '''
+    def __init__(self, frames_in_flight=FRAMES_IN_FLIGHT):
+        self.queries = [{} for _ in range(frames_in_flight)] # name => query
+        self.issued = [[] for _ in range(frames_in_flight)] # (name, query) waiting for a result
+        self.slot = 0
+        self.enabled = False
+        self.dropped = 0 # results that were not ready in time, should stay 0
+
+    def begin_frame(self, profiler):
+        '''
+        moves to the next set of queries and reports the results it held
+        '''
+        if self.enabled and not profiler.enabled:
+            # stale results would be reported as the first frames once profiling is back on
+            self.issued = [[] for _ in self.issued]
+        self.enabled = profiler.enabled
+        if not self.enabled:
+            return
+        self.slot = (self.slot + 1) % len(self.queries)
+        for name, query in self.issued[self.slot]:
+            if not glGetQueryObjectiv(query, GL_QUERY_RESULT_AVAILABLE):
+                # the GPU is more than FRAMES_IN_FLIGHT frames behind, skip instead of waiting
+                self.dropped += 1
+                continue
+            ns = query_result(query)
+            profiler.add(f"gpu_{name}", ns / 1e9)
+        self.issued[self.slot] = []
+
+    def gpu_pass(self, name):
+        if not self.enabled:
+            return NULL_PHASE
+        queries = self.queries[self.slot]
+        query = queries.get(name)
+        if query is None:
+            query = queries[name] = int(glGenQueries(1)[0])
+        self.issued[self.slot].append((name, query))
+        return GpuPass(query)
+
+    def delete(self):
+        ids = [q for queries in self.queries for q in queries.values()]
+        if ids:
+            glDeleteQueries(len(ids), ids)
+        self.queries = [{} for _ in self.queries]
+        self.issued = [[] for _ in self.issued]
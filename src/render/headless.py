@@ -0,0 +1,585 @@
+'''
+Headless rendering for benchmarks
+
+renders a world into an offscreen framebuffer without Qt or a window,
+the GL context comes from EGL (default) or OSMesa, picked by PyOpenGL with
+    PYOPENGL_PLATFORM=egl py -m render.headless --frames 300 --path orbit
+    PYOPENGL_PLATFORM=osmesa py -m render.headless --out timing.json
+OSMesa works on machines without a GPU (software rasterizer)
+
+recorded flythroughs (core.flythrough) are replayed step by step and can be
+compared with an earlier run of the same flight
+    py -m render.headless --flight flight.json --out new.json --compare old.json
+--trace writes a Chrome trace of generation and chunk loading (core.tracing)
+--count-gl counts the GL calls of every timed frame (GLCallCounter)
+'''
+import os
+import sys
+
+# must be set before OpenGL is imported anywhere
+os.environ.setdefault("PYOPENGL_PLATFORM", "egl")
+
+if __name__ == "__main__":
+    sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from OpenGL.GL import *
+
+import ctypes
+import importlib
+import json
+import time
+import numpy as np
+
+GL_VERSION_WANTED = (4, 5) # the shaders are #version 450
+
+class HeadlessContext:
+    '''
+    offscreen GL context, nothing is drawn to the default framebuffer
+    so any size works, draw into a Framebuffer instead
+    '''
+    def __init__(self, width=1280, height=720):
+        self.width = width
+        self.height = height
+        self.platform = os.environ["PYOPENGL_PLATFORM"]
+        if self.platform == "egl":
+            self.create_egl()
+        elif self.platform == "osmesa":
+            self.create_osmesa()
+        else:
+            raise ValueError(f"Unsupported headless platform: {self.platform}")
+
+    def create_egl(self):
+        from OpenGL import EGL
+        self.egl = EGL
+        self.display = EGL.eglGetDisplay(EGL.EGL_DEFAULT_DISPLAY)
+        major, minor = EGL.EGLint(), EGL.EGLint()
+        if not EGL.eglInitialize(self.display, ctypes.pointer(major), ctypes.pointer(minor)):
+            raise RuntimeError("eglInitialize failed")
+        attribs = (EGL.EGLint * 11)(
+            EGL.EGL_SURFACE_TYPE, EGL.EGL_PBUFFER_BIT,
+            EGL.EGL_RENDERABLE_TYPE, EGL.EGL_OPENGL_BIT,
+            EGL.EGL_DEPTH_SIZE, 24,
+            EGL.EGL_RED_SIZE, 8,
+            EGL.EGL_ALPHA_SIZE, 8,
+            EGL.EGL_NONE,
+        )
+        config = EGL.EGLConfig()
+        n = EGL.EGLint()
+        if not EGL.eglChooseConfig(self.display, attribs, ctypes.pointer(config), 1, ctypes.pointer(n)) or n.value == 0:
+            raise RuntimeError("no EGL config with desktop OpenGL")
+        # the window system is never used, a 1x1 pbuffer is enough to make the context current
+        self.surface = EGL.eglCreatePbufferSurface(
+            self.display, config, (EGL.EGLint * 5)(EGL.EGL_WIDTH, 1, EGL.EGL_HEIGHT, 1, EGL.EGL_NONE)
+        )
+        EGL.eglBindAPI(EGL.EGL_OPENGL_API)
+        self.context = EGL.eglCreateContext(
+            self.display, config, EGL.EGL_NO_CONTEXT,
+            (EGL.EGLint * 7)(
+                EGL.EGL_CONTEXT_MAJOR_VERSION, GL_VERSION_WANTED[0],
+                EGL.EGL_CONTEXT_MINOR_VERSION, GL_VERSION_WANTED[1],
+                EGL.EGL_CONTEXT_OPENGL_PROFILE_MASK, EGL.EGL_CONTEXT_OPENGL_CORE_PROFILE_BIT,
+                EGL.EGL_NONE,
+            )
+        )
+        if self.context == EGL.EGL_NO_CONTEXT:
+            raise RuntimeError("eglCreateContext failed")
+        EGL.eglMakeCurrent(self.display, self.surface, self.surface, self.context)
+
+    def create_osmesa(self):
+        from OpenGL import osmesa
+        self.osmesa = osmesa
+        self.context = osmesa.OSMesaCreateContextAttribs([
+            osmesa.OSMESA_FORMAT, osmesa.OSMESA_RGBA,
+            osmesa.OSMESA_DEPTH_BITS, 24,
+            osmesa.OSMESA_PROFILE, osmesa.OSMESA_CORE_PROFILE,
+            osmesa.OSMESA_CONTEXT_MAJOR_VERSION, GL_VERSION_WANTED[0],
+            osmesa.OSMESA_CONTEXT_MINOR_VERSION, GL_VERSION_WANTED[1],
+            0,
+        ], None)
+        if not self.context:
+            raise RuntimeError("OSMesaCreateContextAttribs failed")
+        # OSMesa needs a client buffer to become current, rendering goes to the FBO
+        self.buffer = np.zeros((1, 1, 4), dtype=np.uint8)
+        if not osmesa.OSMesaMakeCurrent(self.context, self.buffer, GL_UNSIGNED_BYTE, 1, 1):
+            raise RuntimeError("OSMesaMakeCurrent failed")
+
+    def renderer(self):
+        return f"{glGetString(GL_RENDERER).decode()} ({glGetString(GL_VERSION).decode()})"
+
+    def destroy(self):
+        if self.platform == "egl":
+            EGL = self.egl
+            EGL.eglMakeCurrent(self.display, EGL.EGL_NO_SURFACE, EGL.EGL_NO_SURFACE, EGL.EGL_NO_CONTEXT)
+            EGL.eglDestroyContext(self.display, self.context)
+            EGL.eglDestroySurface(self.display, self.surface)
+            EGL.eglTerminate(self.display)
+        else:
+            self.osmesa.OSMesaDestroyContext(self.context)
+
+class Framebuffer:
+    '''
+    colour + depth render target
+    '''
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.fbo = glGenFramebuffers(1)
+        self.color, self.depth = glGenRenderbuffers(2)
+        glBindRenderbuffer(GL_RENDERBUFFER, self.color)
+        glRenderbufferStorage(GL_RENDERBUFFER, GL_RGBA8, width, height)
+        glBindRenderbuffer(GL_RENDERBUFFER, self.depth)
+        glRenderbufferStorage(GL_RENDERBUFFER, GL_DEPTH_COMPONENT24, width, height)
+        glBindFramebuffer(GL_FRAMEBUFFER, self.fbo)
+        glFramebufferRenderbuffer(GL_FRAMEBUFFER, GL_COLOR_ATTACHMENT0, GL_RENDERBUFFER, self.color)
+        glFramebufferRenderbuffer(GL_FRAMEBUFFER, GL_DEPTH_ATTACHMENT, GL_RENDERBUFFER, self.depth)
+        if glCheckFramebufferStatus(GL_FRAMEBUFFER) != GL_FRAMEBUFFER_COMPLETE:
+            raise RuntimeError("offscreen framebuffer is incomplete")
+
+    def bind(self):
+        glBindFramebuffer(GL_FRAMEBUFFER, self.fbo)
+        glViewport(0, 0, self.width, self.height)
+
+    def read_pixels(self):
+        '''
+        RGB image as a (height, width, 3) uint8 array, top row first
+        '''
+        glBindFramebuffer(GL_READ_FRAMEBUFFER, self.fbo)
+        glPixelStorei(GL_PACK_ALIGNMENT, 1)
+        data = glReadPixels(0, 0, self.width, self.height, GL_RGB, GL_UNSIGNED_BYTE)
+        return np.frombuffer(data, dtype=np.uint8).reshape(self.height, self.width, 3)[::-1]
+
+    def save_ppm(self, path):
+        image = self.read_pixels()
+        with open(path, 'wb') as f:
+            f.write(f"P6 {self.width} {self.height} 255\n".encode())
+            f.write(image.tobytes())
+
+    def delete(self):
+        glDeleteFramebuffers(1, [self.fbo])
+        glDeleteRenderbuffers(2, [self.color, self.depth])
+
+class GLCallCounter:
+    '''
+    counts the gl* calls of the modules that draw. They get GL with
+    "from OpenGL.GL import *", so the names are wrapped in their globals;
+    calls through other names (render.gpu_timer.query_result) are not counted
+    '''
+    MODULES = (
+        "render.world_manager", "render.shader", "render.occlusion",
+        "render.gpu_timer", "render.palette", "render.object_manager",
+    )
+    def __init__(self, modules=()):
+        self.modules = [importlib.import_module(name) for name in self.MODULES] + list(modules)
+        self.counts = {}
+        self.patched = []
+
+    def wrap(self, name, func):
+        counts = self.counts
+        def counted(*args, **kwargs):
+            counts[name] = counts.get(name, 0) + 1
+            return func(*args, **kwargs)
+        return counted
+
+    def install(self):
+        for module in self.modules:
+            for name, value in list(vars(module).items()):
+                if name.startswith("gl") and callable(value):
+                    self.patched.append((module, name, value))
+                    setattr(module, name, self.wrap(name, value))
+
+    def uninstall(self):
+        for module, name, value in self.patched:
+            setattr(module, name, value)
+        self.patched = []
+
+    def take(self):
+        '''
+        returns the counts since the last take and starts over
+        '''
+        counts = dict(self.counts)
+        self.counts.clear()
+        return counts
+
+class HeadlessRenderer:
+    '''
+    draws a world the same way GenerationViewWidget.paintGL does
+    '''
+    def __init__(self, width=1280, height=720):
+        # imported here, after the platform is picked and the context exists
+        from core.camera import Camera
+        from render.palette import Palette
+        from render.shader import Shader, FrameUniforms, SHADER_DIR
+        from render.world_manager import init_gl_state
+        from render.frame_profiler import FrameProfiler
+        from core.flythrough import SimClock
+
+        self.context = HeadlessContext(width, height)
+        self.framebuffer = Framebuffer(width, height)
+        self.framebuffer.bind()
+        init_gl_state()
+        self.shader = Shader(
+            os.path.join(SHADER_DIR, "world_v.vert"),
+            os.path.join(SHADER_DIR, "world_f.frag")
+        )
+        self.frame_uniforms = FrameUniforms()
+        self.palette = Palette()
+        self.camera = Camera()
+        self.world = None
+        # the world ticks, rises and fades on simulated time and the shader gets
+        # the same time, so runs of the same path see the same world in every frame
+        self.clock = SimClock()
+        self.ticks = None
+        # phase times of the timed frames, swap is the glFinish at the end
+        self.profiler = FrameProfiler(enabled=False)
+        self.gl_counter = None # GLCallCounter while GL calls are counted
+        self.gl_frames = [] # (GL calls, chunks drawn) of every timed frame
+        self.gl_totals = {}
+
+    def count_gl_calls(self):
+        '''
+        counts the GL calls of every timed frame from now on, the wrappers
+        slow the frames down, so the timings of such a run are not comparable
+        '''
+        self.gl_counter = GLCallCounter([sys.modules[__name__]])
+        self.gl_counter.install()
+
+    def record_gl_frame(self):
+        if self.gl_counter is None:
+            return
+        counts = self.gl_counter.take()
+        world = self.world
+        drawn = 0
+        if world is not None:
+            drawn = sum(1 for chunk in world.chunk_list if chunk.vao is not None and world.is_visible(chunk))
+        self.gl_frames.append((sum(counts.values()), drawn))
+        for name, n in counts.items():
+            self.gl_totals[name] = self.gl_totals.get(name, 0) + n
+
+    def reset_gl_frames(self):
+        if self.gl_counter is not None:
+            self.gl_counter.take()
+        self.gl_frames = []
+        self.gl_totals = {}
+
+    def gl_report(self):
+        '''
+        GL calls per frame, in total and by function, next to the number of chunks drawn
+        '''
+        n = len(self.gl_frames)
+        if n == 0:
+            return {}
+        calls = np.array([c for c, _ in self.gl_frames], dtype=np.float64)
+        drawn = np.array([d for _, d in self.gl_frames], dtype=np.float64)
+        return {
+            'gl_calls_per_frame': float(calls.mean()),
+            'gl_calls_max': int(calls.max()),
+            'chunks_drawn': float(drawn.mean()),
+            'gl_calls_by_name': {
+                name: total/n for name, total in sorted(self.gl_totals.items(), key=lambda item: -item[1])
+            },
+        }
+
+    def generate(self, seed=1, rings=6, obj_intensity=0.05, height_intensity=0.3, streaming=False):
+        '''
+        builds a world and uploads all of its chunks before anything is timed
+        '''
+        from core.chunk_source import ProceduralSource
+        from core.generation import generate_world
+        from core.fixed_step import FixedStep
+        from render.world_manager import World
+
+        if self.world is not None:
+            self.world.close()
+        if streaming:
+            self.world = World(
+                {},{},{},seed=seed,shader=self.shader,n_rings=rings,obj_intensity=obj_intensity,
+                height_intensity=height_intensity,streaming=True,
+                source=ProceduralSource(seed,obj_intensity,height_intensity)
+            )
+            self.world.clock = self.clock
+            self.world.set_focus(self.camera.pos)
+            self.world.update_streaming()
+        else:
+            rg_info,y_info,obj_info = generate_world(seed,rings,obj_intensity,height_intensity)
+            self.world = World(
+                y_info,rg_info,obj_info,seed=seed,shader=self.shader,n_rings=rings,
+                obj_intensity=obj_intensity,height_intensity=height_intensity
+            )
+            self.world.clock = self.clock
+            self.world.generate_mesh()
+        self.ticks = FixedStep(1/World.TICK_RATE, clock=self.clock)
+        self.settle()
+        return self.world
+
+    def load_all(self):
+        world = self.world
+        while world.chunk_scheduled:
+            world.generate_chunk()
+        while world.loading:
+            world.add_loaded()
+            time.sleep(0.001)
+        while any(chunk.pending for chunk in world.chunk_list):
+            world.upload_ready()
+            time.sleep(0.001)
+        world.upload_ready()
+
+    def settle(self):
+        '''
+        lets every chunk finish loading, rising and fading in, the timed frames
+        start from a finished world
+        '''
+        world = self.world
+        self.load_all()
+        while not world.is_idle():
+            self.advance(1/world.TICK_RATE)
+            self.load_all()
+            self.render_frame()
+
+    def wait_meshes(self):
+        '''
+        waits until the mesh workers are done with every submitted chunk, so what
+        a frame uploads does not depend on how fast the worker threads were
+        '''
+        world = self.world
+        while sum(chunk.pending for chunk in world.chunk_list) > world.mesh_pool.results.qsize():
+            time.sleep(0.0005)
+
+    def advance(self, dt):
+        '''
+        moves the simulated clock, the world runs World.step() at its tick rate on it
+        '''
+        self.clock.advance(dt)
+        if self.world is None:
+            return
+        with self.profiler.phase("perf_tick"):
+            for _ in range(self.ticks.advance()):
+                self.world.step()
+
+    def render_frame(self):
+        self.framebuffer.bind()
+        glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+        self.palette.bind()
+        self.frame_uniforms.update(
+            self.camera.view_matr(),
+            self.camera.proj_matr(self.framebuffer.width, self.framebuffer.height),
+            self.clock()
+        )
+        if self.world is not None:
+            self.world.profiler = self.profiler
+            self.world.set_focus(self.camera.pos,self.camera.get_dir(),self.camera.fov,self.framebuffer.width/self.framebuffer.height)
+            self.world.render()
+
+    def run(self, path, frames=300, warmup=30):
+        '''
+        renders frames evenly spread over the camera path, returns the timings
+        glFinish after every frame, so the times include the GPU work
+        the simulated clock moves by the same time as the camera between frames
+        '''
+        frame_ms = []
+        dt = path.duration / max(1, frames - 1)
+        for i in range(warmup + frames):
+            if i == warmup:
+                self.profiler.reset()
+                self.reset_gl_frames()
+            t = path.duration * max(0, i - warmup) / max(1, frames - 1)
+            with self.profiler.phase("camera"):
+                path.apply(self.camera, t)
+            self.wait_meshes()
+            start = time.perf_counter()
+            if i > warmup:
+                self.advance(dt)
+            self.render_frame()
+            with self.profiler.phase("swap"):
+                glFinish()
+            if i >= warmup:
+                frame_ms.append((time.perf_counter() - start)*1000)
+                self.record_gl_frame()
+            self.profiler.next_frame()
+        report = timing_report(frame_ms, self)
+        report.update(self.gl_report())
+        return report
+
+    def run_flight(self, flight, warmup=30):
+        '''
+        renders one frame per step of the flight, the camera, the world and the
+        shader time move by the flight timestep per step, returns frame, CPU and GPU times
+        CPU time is until all commands are submitted, GPU time comes from two
+        GL_TIMESTAMP queries around the frame (the passes use time elapsed queries,
+        which cannot be nested)
+        '''
+        from render.gpu_timer import query_result
+
+        # warm up at the start of the flight
+        flight.reset(self.camera)
+        for _ in range(warmup):
+            self.render_frame()
+        glFinish()
+        self.profiler.reset()
+        self.reset_gl_frames()
+
+        queries = glGenQueries(2)
+        frame_ms, cpu_ms, gpu_ms = [], [], []
+        steps = flight.replay(self.camera)
+        while True:
+            with self.profiler.phase("camera"):
+                step = next(steps, None)
+            if step is None:
+                break
+            self.wait_meshes()
+            start = time.perf_counter()
+            glQueryCounter(queries[0], GL_TIMESTAMP)
+            if step[0] > 0:
+                self.advance(flight.timestep)
+            self.render_frame()
+            glQueryCounter(queries[1], GL_TIMESTAMP)
+            submitted = time.perf_counter()
+            with self.profiler.phase("swap"):
+                glFinish()
+            done = time.perf_counter()
+            self.profiler.next_frame()
+            cpu_ms.append((submitted - start)*1000)
+            frame_ms.append((done - start)*1000)
+            gpu_ns = query_result(queries[1]) - query_result(queries[0])
+            gpu_ms.append(gpu_ns / 1e6)
+            self.record_gl_frame()
+        glDeleteQueries(2, queries)
+        report = timing_report(frame_ms, self, cpu_ms, gpu_ms)
+        report.update(self.gl_report())
+        report['flight'] = flight.digest()
+        report['seed'] = flight.seed
+        report['rings'] = flight.rings
+        return report
+
+    def close(self):
+        if self.gl_counter is not None:
+            self.gl_counter.uninstall()
+            self.gl_counter = None
+        if self.world is not None:
+            self.world.close()
+        self.framebuffer.delete()
+        self.context.destroy()
+
+def summary(values):
+    '''
+    mean, min, max and percentiles of a list of times in ms
+    '''
+    times = np.array(values, dtype=np.float64)
+    if len(times) == 0:
+        return {key: 0.0 for key in ('mean_ms', 'min_ms', 'max_ms', 'p50_ms', 'p95_ms', 'p99_ms')}
+    p50, p95, p99 = np.percentile(times, (50, 95, 99))
+    return {
+        'mean_ms': float(times.mean()),
+        'min_ms': float(times.min()),
+        'max_ms': float(times.max()),
+        'p50_ms': float(p50),
+        'p95_ms': float(p95),
+        'p99_ms': float(p99),
+    }
+
+def timing_report(frame_ms, renderer=None, cpu_ms=None, gpu_ms=None):
+    report = {'frames': len(frame_ms)}
+    report.update(summary(frame_ms))
+    report['fps'] = 1000 / report['mean_ms'] if report['mean_ms'] > 0 else 0.0
+    report['frame_ms'] = [round(t, 4) for t in frame_ms]
+    if cpu_ms is not None:
+        report['cpu'] = summary(cpu_ms)
+        report['cpu_ms'] = [round(t, 4) for t in cpu_ms]
+    if gpu_ms is not None:
+        report['gpu'] = summary(gpu_ms)
+        report['gpu_ms'] = [round(t, 4) for t in gpu_ms]
+    if renderer is not None:
+        report.update({
+            'platform': renderer.context.platform,
+            'renderer': renderer.context.renderer(),
+            'width': renderer.framebuffer.width,
+            'height': renderer.framebuffer.height,
+        })
+        if renderer.world is not None:
+            report['chunks'] = len(renderer.world.chunk_list)
+    return report
+
+def compare(base, new):
+    '''
+    prints how the percentiles changed between two reports of the same flight
+    '''
+    if base.get('flight') != new.get('flight') or base.get('seed') != new.get('seed'):
+        print("warning: the reports are not from the same flight and seed")
+    for name in ('frame', 'cpu', 'gpu'):
+        a = base if name == 'frame' else base.get(name)
+        b = new if name == 'frame' else new.get(name)
+        if not a or not b:
+            continue
+        changes = []
+        for key in ('p50_ms', 'p95_ms', 'p99_ms'):
+            change = 100*(b[key] - a[key])/a[key] if a[key] else 0.0
+            changes.append(f"{key[:3]} {a[key]:.2f} -> {b[key]:.2f}ms ({change:+.1f}%)")
+        print(f"{name}: " + ", ".join(changes))
+
+if __name__ == "__main__":
+    import argparse
+    from core.camera_path import PATHS
+    from core.flythrough import Flight
+    from core import tracing
+
+    parser = argparse.ArgumentParser(description="render a world offscreen and time the frames")
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--warmup", type=int, default=30)
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--rings", type=int, default=6)
+    parser.add_argument("--streaming", action="store_true")
+    parser.add_argument("--path", choices=sorted(PATHS), default="orbit")
+    parser.add_argument("--flight", help="replay a recorded flythrough, its seed and rings are used")
+    parser.add_argument("--compare", help="earlier json report to compare the timings with")
+    parser.add_argument("--profile", help="write per-phase frame times as .csv or .json")
+    parser.add_argument("--out", help="write the timings as json")
+    parser.add_argument("--save-frame", help="write the last frame as a .ppm image")
+    parser.add_argument("--trace", help="write a Chrome trace (.json) of generation and chunk loading")
+    parser.add_argument("--count-gl", action="store_true", help="count the GL calls per frame (slows the frames down)")
+    args = parser.parse_args()
+    if args.trace:
+        tracing.enable()
+
+    flight = Flight.load(args.flight) if args.flight else None
+    seed, rings = args.seed, args.rings
+    if flight is not None:
+        seed = flight.seed if flight.seed is not None else seed
+        rings = flight.rings if flight.rings is not None else rings
+
+    renderer = HeadlessRenderer(args.width, args.height)
+    renderer.profiler.set_enabled(bool(args.profile))
+    try:
+        renderer.generate(seed, rings, streaming=args.streaming)
+        if args.count_gl:
+            renderer.count_gl_calls()
+        if flight is not None:
+            report = renderer.run_flight(flight, args.warmup)
+        else:
+            report = renderer.run(PATHS[args.path](), args.frames, args.warmup)
+        if args.save_frame:
+            renderer.framebuffer.save_ppm(args.save_frame)
+        if args.profile:
+            renderer.profiler.export(args.profile)
+            print(renderer.profiler.overlay_text())
+    finally:
+        renderer.close()
+        if args.trace:
+            tracing.export(args.trace)
+    print(f"{report['renderer']}: {report['frames']} frames, {report['mean_ms']:.2f}ms avg, "
+          f"{report['max_ms']:.2f}ms max, {report['fps']:.1f} fps, {report.get('chunks', 0)} chunks")
+    for name in ('cpu', 'gpu'):
+        if name in report:
+            s = report[name]
+            print(f"{name}: p50 {s['p50_ms']:.2f}ms, p95 {s['p95_ms']:.2f}ms, p99 {s['p99_ms']:.2f}ms")
+    if 'gl_calls_per_frame' in report:
+        print(f"gl calls: {report['gl_calls_per_frame']:.1f} per frame (max {report['gl_calls_max']}), "
+              f"{report['chunks_drawn']:.1f} chunks drawn")
+        for name, n in list(report['gl_calls_by_name'].items())[:12]:
+            print(f"    {name:32s} {n:8.1f}")
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
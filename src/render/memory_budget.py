@@ -0,0 +1,71 @@
+'''
+Chunk memory accounting
+'''
+
+class MemoryBudget:
+    '''
+    keeps track of how much CPU and GPU memory every chunk uses and
+    which chunks should give up their GPU buffers once the GPU part
+    is over the limit (least recently visible first)
+
+    only GPU memory has a limit, the CPU number is an estimate for the stats
+    '''
+    def __init__(self, gpu_limit=256*1024*1024):
+        self.gpu_limit = gpu_limit
+        self.entries = {} # chunk => [cpu_bytes, gpu_bytes, last visible frame]
+        self.cpu_bytes = 0
+        self.gpu_bytes = 0
+        self.evictions = 0
+
+    def track(self, chunk, frame=0):
+        '''
+        updates the sizes of a chunk, call after every upload
+        '''
+        entry = self.entries.get(chunk)
+        if entry is None:
+            entry = self.entries[chunk] = [0, 0, frame]
+        self.cpu_bytes += chunk.cpu_bytes() - entry[0]
+        self.gpu_bytes += chunk.gpu_bytes - entry[1]
+        entry[0] = chunk.cpu_bytes()
+        entry[1] = chunk.gpu_bytes
+
+    def touch(self, chunk, frame):
+        entry = self.entries.get(chunk)
+        if entry is not None:
+            entry[2] = frame
+
+    def forget(self, chunk):
+        entry = self.entries.pop(chunk, None)
+        if entry is not None:
+            self.cpu_bytes -= entry[0]
+            self.gpu_bytes -= entry[1]
+
+    def evict(self, frame):
+        '''
+        returns the chunks whose GPU buffers should be freed to get under
+        the limit, chunks that were visible in this frame are never picked
+        '''
+        if self.gpu_bytes <= self.gpu_limit:
+            return []
+        candidates = sorted(
+            (entry[2], id(chunk), chunk) for chunk, entry in self.entries.items()
+            if entry[1] > 0 and entry[2] < frame
+        )
+        evicted = []
+        over = self.gpu_bytes - self.gpu_limit
+        for _, _, chunk in candidates:
+            if over <= 0:
+                break
+            over -= self.entries[chunk][1]
+            evicted.append(chunk)
+        self.evictions += len(evicted)
+        return evicted
+
+    def stats(self):
+        return {
+            'chunks': len(self.entries),
+            'cpu_bytes': self.cpu_bytes,
+            'gpu_bytes': self.gpu_bytes,
+            'gpu_limit': self.gpu_limit,
+            'evictions': self.evictions,
+        }
@@ -0,0 +1,89 @@
+'''
+Object level of detail utility
+
+LOD meshes are built by vertex clustering and can be baked offline with
+    py -m render.mesh_lod
+which writes static/assets/lod/<model>_lod<n>.obj for every object model
+'''
+import os
+import numpy as np
+
+# clustering grid cells along the longest side of the model, per level
+# level 0 is the original mesh, the level after the last one is the billboard
+LOD_RESOLUTIONS = (None, 10, 5)
+BILLBOARD = len(LOD_RESOLUTIONS)
+
+def lod_path(path, level):
+    name = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(os.path.dirname(path), "lod", f"{name}_lod{level}.obj")
+
+def decimate(vertices, faces, resolution):
+    '''
+    merges all vertices that fall into the same grid cell into their average
+    and drops the triangles that collapse, returns (vertices, faces)
+    '''
+    if len(vertices) == 0:
+        return vertices, faces
+    lo = vertices.min(axis=0)
+    cell = float((vertices.max(axis=0) - lo).max()) / resolution or 1.0
+    keys = np.floor((vertices - lo) / cell).astype(np.int64)
+    _, cluster, counts = np.unique(keys, axis=0, return_inverse=True, return_counts=True)
+    cluster = cluster.ravel()
+
+    new_vertices = np.zeros((len(counts), 3), dtype=np.float64)
+    np.add.at(new_vertices, cluster, vertices)
+    new_vertices /= counts[:, None]
+
+    new_faces = cluster[faces]
+    keep = (new_faces[:, 0] != new_faces[:, 1]) \
+        & (new_faces[:, 1] != new_faces[:, 2]) \
+        & (new_faces[:, 0] != new_faces[:, 2])
+    new_faces = np.unique(new_faces[keep], axis=0)
+    return new_vertices.astype(np.float32), new_faces.astype(np.uint32)
+
+def billboard(vertices):
+    '''
+    two crossed, double sided quads with the size of the model
+    '''
+    lo = vertices.min(axis=0)
+    hi = vertices.max(axis=0)
+    mid = (lo + hi) / 2
+    new_vertices = np.array([
+        [lo[0], lo[1], mid[2]], [hi[0], lo[1], mid[2]], [hi[0], hi[1], mid[2]], [lo[0], hi[1], mid[2]],
+        [mid[0], lo[1], lo[2]], [mid[0], lo[1], hi[2]], [mid[0], hi[1], hi[2]], [mid[0], hi[1], lo[2]],
+    ], dtype=np.float32)
+    quad = [(0, 1, 2), (0, 2, 3), (0, 2, 1), (0, 3, 2)]
+    new_faces = np.array(
+        [[a, b, c] for base in (0, 4) for a, b, c in ((base+i, base+j, base+k) for i, j, k in quad)],
+        dtype=np.uint32
+    )
+    return new_vertices, new_faces
+
+def build_lod(vertices, faces, level):
+    if level == 0:
+        return vertices, faces
+    if level >= BILLBOARD:
+        return billboard(vertices)
+    return decimate(vertices, faces, LOD_RESOLUTIONS[level])
+
+def write_obj(path, vertices, faces):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        for x, y, z in vertices:
+            f.write(f"v {x:.5f} {y:.5f} {z:.5f}\n")
+        for a, b, c in faces:
+            f.write(f"f {a+1} {b+1} {c+1}\n")
+
+if __name__ == "__main__":
+    import sys
+    sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+    from core.object_gen import ASSETS_DIR, OBJECT_MODELS
+    from render.object_manager import load_mesh
+
+    for model in OBJECT_MODELS:
+        path = os.path.join(ASSETS_DIR, model)
+        vertices, faces = load_mesh(path)
+        for level in range(1, BILLBOARD):
+            lod_v, lod_f = build_lod(vertices, faces, level)
+            write_obj(lod_path(path, level), lod_v, lod_f)
+            print(f"{model} lod{level}: {len(faces)} -> {len(lod_f)} triangles")
@@ -0,0 +1,135 @@
+'''
+Background chunk meshing utility
+'''
+import os
+import queue
+import threading
+import time
+
+from core.tracing import span
+
+class MeshWorkerPool:
+    '''
+    builds chunk vertex/index arrays on worker threads
+
+    the GL thread submits chunks and later drains the finished meshes,
+    only the buffer uploads are left for it to do. The data of new chunks
+    (generated or read from a file) is loaded on the same threads
+    '''
+    def __init__(self, n_workers=None):
+        if n_workers is None:
+            n_workers = max(1, min(4, (os.cpu_count() or 2) - 1))
+        self.jobs = queue.Queue()
+        self.results = queue.Queue()
+        self.loaded = queue.Queue()
+
+        self.lock = threading.Lock()
+        self.jobs_done = 0
+        self.total_wait = 0.0
+        self.total_build = 0.0
+        self.max_build = 0.0
+
+        self.workers = []
+        for i in range(n_workers):
+            worker = threading.Thread(target=self._run, name=f"mesh-worker-{i}", daemon=True)
+            worker.start()
+            self.workers.append(worker)
+
+    def submit(self, chunk):
+        '''
+        schedules a chunk rebuild, a chunk is never queued twice
+        returns False if the chunk is already waiting for a worker
+        '''
+        if chunk.pending:
+            return False
+        chunk.pending = True
+        # taken here on the GL thread, the worker only reads the snapshot
+        self.jobs.put(('mesh', chunk, chunk.mesh_state(), time.perf_counter()))
+        return True
+
+    def load(self, key, load_fn):
+        '''
+        schedules load_fn(*key) on a worker, drain_loaded() hands back the result
+        '''
+        self.jobs.put(('load', key, load_fn, time.perf_counter()))
+
+    def drain(self, max_items=None):
+        '''
+        returns a list of (chunk, mesh) pairs that are ready to be uploaded
+        '''
+        ready = []
+        while max_items is None or len(ready) < max_items:
+            try:
+                ready.append(self.results.get_nowait())
+            except queue.Empty:
+                break
+        return ready
+
+    def drain_loaded(self, max_items=None):
+        '''
+        returns a list of (key, data) pairs of finished loads,
+        data is None if loading failed
+        '''
+        ready = []
+        while max_items is None or len(ready) < max_items:
+            try:
+                ready.append(self.loaded.get_nowait())
+            except queue.Empty:
+                break
+        return ready
+
+    def _load(self, key, load_fn):
+        try:
+            with span("chunk_data", "chunk", x=key[0], z=key[1]):
+                data = load_fn(*key)
+        except Exception as e:
+            print('chunk loading went wrong: ', e)
+            data = None
+        self.loaded.put((key, data))
+
+    def _run(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                return
+            kind, target, arg, submitted = job
+            if kind == 'load':
+                self._load(target, arg)
+                continue
+            chunk, state = target, arg
+            started = time.perf_counter()
+            try:
+                with span("build_mesh", "chunk", x=chunk.center_x, z=chunk.center_z):
+                    mesh = chunk.build_mesh(state)
+            except Exception as e:
+                print('chunk meshing went wrong: ', e)
+                chunk.pending = False
+                continue
+            finished = time.perf_counter()
+            with self.lock:
+                self.jobs_done += 1
+                self.total_wait += started - submitted
+                self.total_build += finished - started
+                self.max_build = max(self.max_build, finished - started)
+            self.results.put((chunk, mesh))
+
+    def stats(self):
+        '''
+        queue depths and worker latencies (in ms)
+        '''
+        with self.lock:
+            done = self.jobs_done
+            return {
+                'queued': self.jobs.qsize(),
+                'ready': self.results.qsize(),
+                'loaded': self.loaded.qsize(),
+                'jobs_done': done,
+                'avg_wait_ms': 1000 * self.total_wait / done if done else 0.0,
+                'avg_build_ms': 1000 * self.total_build / done if done else 0.0,
+                'max_build_ms': 1000 * self.max_build,
+            }
+
+    def shutdown(self):
+        for _ in self.workers:
+            self.jobs.put(None)
+        self.workers = []
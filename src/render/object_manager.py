@@ -8,14 +8,59 @@ from math import cos, sin
 
 from core.matrix_util import Matrix4D,Vector3D,Vector4D,Matrix3D
 from core.enums import ObjectViewType,RotationAxis
+from render.mesh_lod import build_lod, lod_path
+from core.tracing import span
 
+import os
 import random as rand
+import threading
+import numpy as np
+
+_mesh_cache = {}
+_mesh_lock = threading.Lock()
+_lod_cache = {}
+_lod_lock = threading.Lock() # taken before _mesh_lock, never the other way round
+
+def load_mesh(path):
+    '''
+    parses an .obj file once and returns its (vertices, faces) as numpy arrays
+    the result is shared between all objects that use the same file
+    '''
+    with _mesh_lock:
+        if path not in _mesh_cache:
+            with span("load_mesh", "asset", path=os.path.basename(path)):
+                info = Wavefront(path, collect_faces=True,create_materials=False)
+                vertices = np.array([v[:3] for v in info.vertices], dtype=np.float32).reshape(-1, 3)
+                faces = np.array(
+                    [face[:3] for mesh in info.mesh_list for face in mesh.faces],
+                    dtype=np.uint32
+                ).reshape(-1, 3)
+                _mesh_cache[path] = (vertices, faces)
+        return _mesh_cache[path]
+
+def load_lod_mesh(path, level):
+    '''
+    (vertices, faces) of a LOD level of an .obj file,
+    baked LOD files are used when they exist, otherwise the level is built on first use
+    '''
+    if level == 0:
+        return load_mesh(path)
+    key = (path, level)
+    with _lod_lock:
+        if key not in _lod_cache:
+            baked = lod_path(path, level)
+            if os.path.isfile(baked):
+                mesh = load_mesh(baked)
+            else:
+                with span("build_lod", "asset", path=os.path.basename(path), level=level):
+                    mesh = build_lod(*load_mesh(path), level)
+            _lod_cache[key] = mesh
+        return _lod_cache[key]
 
 class Object3D:
     def __init__(self, path):
-        self.info = Wavefront(path, collect_faces=True,create_materials=False) # path - path to the .obj file of the object
-        self.m_list = self.info.mesh_list
-        self.vi_list = self.info.vertices
+        self.path = path # path - path to the .obj file of the object
+        self.vertices, self.faces = load_mesh(path)
         self.transform = Matrix4D(
             1, 0, 0, 0,
             0, 1, 0, 0,
@@ -67,21 +112,22 @@ class Object3D:
                     0,  0, 0, 1
                 )
         self.transform = r_matrix @ self.transform
-    def get_mesh(self, o_v_count,info):
-        v_list = []
-        i_list = []
+    def get_mesh(self, o_v_count,info,lod=0,dy=0.0):
+        '''
+        returns (vertex count, vertex array, index array) of the transformed object,
+        indices are offset by o_v_count
+        lod picks a simplified version of the mesh (see render.mesh_lod)
+        dy moves the mesh up without changing the object, objects are shared
+        between threads and only read here
+        '''
         info[1]=info[1]+5 # object region is block_region+5
         # this is a temporary solution so that objects are more distinguishable
-        for x, y, z in self.vi_list:
-            vec = self.transform @ Vector4D(x, y, z, 1)
-            v_list.extend([vec[0], vec[1], vec[2]]+info)
-            # v_list.extend([vec[0], vec[1], vec[2]] + col)
-        for mesh in self.m_list:
-            for face in mesh.faces:
-                i_list.extend([
-                    o_v_count+face[0], 
-                    o_v_count+face[1], 
-                    o_v_count+face[2]
-                    ])
-
-        return len(v_list),v_list,i_list
+        vertices, faces = (self.vertices, self.faces) if lod == 0 else load_lod_mesh(self.path, lod)
+        m = self.transform.data
+        v_list = np.empty((len(vertices), 7), dtype=np.float32)
+        v_list[:, :3] = vertices @ m[:3, :3].T + m[:3, 3]
+        if dy:
+            v_list[:, 1] += dy
+        v_list[:, 3:] = info
+        i_list = faces.ravel() + o_v_count
+        return len(vertices),v_list.ravel(),i_list
@@ -0,0 +1,107 @@
+'''
+Occlusion queries for chunk objects
+
+after the terrain is drawn, the bounding box of every chunk is drawn into
+the depth buffer with an occlusion query (colour and depth writes off).
+The objects of the chunk are then drawn with conditional rendering, so the
+GPU skips them when no sample of the box passed the depth test
+'''
+from render.shader import Shader, SHADER_DIR
+
+from OpenGL.GL import *
+
+import os
+import numpy as np
+
+# unit cube, same corner order as world_manager.CUBE_CORNERS
+BOX_CORNERS = np.array([
+    [-1,0,-1], [1,0,-1], [1,0,1], [-1,0,1],
+    [-1,1,-1], [1,1,-1], [1,1,1], [-1,1,1],
+], dtype=np.float32)
+
+class OcclusionCuller:
+    '''
+    owns the box shader and mesh and counts how many chunks were occluded,
+    results are read one frame late so the CPU never waits for the GPU
+    '''
+    # boxes are a bit larger than the chunk, so they are not hidden by their own terrain
+    MARGIN = 0.05
+
+    def __init__(self, index_buffer, index_type):
+        self.shader = Shader(
+            os.path.join(SHADER_DIR, "bbox_v.vert"),
+            os.path.join(SHADER_DIR, "bbox_f.frag")
+        )
+        self.box_loc = self.shader.location("box")
+        self.index_type = index_type
+        self.vao = glGenVertexArrays(1)
+        self.vbo = glGenBuffers(1)
+        glBindVertexArray(self.vao)
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        glBufferData(GL_ARRAY_BUFFER, BOX_CORNERS.nbytes, BOX_CORNERS, GL_STATIC_DRAW)
+        # the first cube of the shared terrain index buffer
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, index_buffer)
+        glVertexAttribPointer(0, 3, GL_FLOAT, GL_FALSE, 12, ctypes.c_void_p(0))
+        glEnableVertexAttribArray(0)
+        glBindVertexArray(0)
+
+        self.tested = 0 # chunks with a query in the last finished frame
+        self.occluded = 0 # of those, chunks whose objects were skipped
+        self.queries = 0 # queries issued in the current frame
+
+    def collect(self, chunks):
+        '''
+        counts the results of last frame's queries that are already available
+        '''
+        tested = occluded = 0
+        for chunk in chunks:
+            if not chunk.query_issued:
+                continue
+            if not glGetQueryObjectuiv(chunk.query, GL_QUERY_RESULT_AVAILABLE):
+                continue
+            chunk.query_issued = False
+            tested += 1
+            chunk.occluded = not glGetQueryObjectuiv(chunk.query, GL_QUERY_RESULT)
+            occluded += chunk.occluded
+        self.tested = tested
+        self.occluded = occluded
+
+    def test(self, chunks):
+        '''
+        issues one query per chunk against the current depth buffer
+        '''
+        self.queries = 0
+        self.shader.use()
+        glColorMask(GL_FALSE, GL_FALSE, GL_FALSE, GL_FALSE)
+        glDepthMask(GL_FALSE)
+        # the camera may be inside a box, back faces still have to count
+        glDisable(GL_CULL_FACE)
+        glBindVertexArray(self.vao)
+        for chunk in chunks:
+            if chunk.query is None:
+                chunk.query = int(glGenQueries(1)[0]) # a one element array, unlike glGenBuffers(1)
+            glUniform4f(
+                self.box_loc, chunk.center_x, chunk.center_z,
+                chunk.half_width + self.MARGIN, chunk.top + self.MARGIN
+            )
+            glBeginQuery(GL_ANY_SAMPLES_PASSED, chunk.query)
+            glDrawElements(GL_TRIANGLES, 36, self.index_type, None)
+            glEndQuery(GL_ANY_SAMPLES_PASSED)
+            chunk.query_issued = True
+            self.queries += 1
+        glBindVertexArray(0)
+        glEnable(GL_CULL_FACE)
+        glDepthMask(GL_TRUE)
+        glColorMask(GL_TRUE, GL_TRUE, GL_TRUE, GL_TRUE)
+
+    def stats(self):
+        return {
+            'occlusion_queries': self.queries,
+            'occlusion_tested': self.tested,
+            'occluded': self.occluded,
+        }
+
+    def delete(self):
+        glDeleteVertexArrays(1, [self.vao])
+        glDeleteBuffers(1, [self.vbo])
+        self.shader.delete()
@@ -0,0 +1,101 @@
+'''
+Colour palette texture of regions and objects
+
+every row is one colour scheme, terrain rows go from low to high blocks,
+the row is picked by the region value of a vertex (objects use region+5)
+'''
+from core.enums import Region
+
+from OpenGL.GL import *
+
+import numpy as np
+
+PALETTE_UNIT = 0 # texture unit, same as the binding in world_f.frag
+PALETTE_WIDTH = 64 # texels along the height axis
+
+# low, middle and high colour of every region
+REGION_GRADIENTS = {
+    Region.STEPPE: ((0.94, 1, 0.25), (0.58, 0.89, 0.14), (0.29, 0.85, 0.07)),
+    Region.FOREST: ((0.14, 0.91, 0.32), (0.06, 0.64, 0.37), (0.04, 0.47, 0.03)),
+    Region.HILLS: ((0.79, 1, 0.45), (0.2, 0.93, 0.23), (0.08, 0.69, 0.27)),
+    Region.MOUNTAINS: ((0.1, 0.1, 0.1), (0.4, 0.4, 0.4), (0.7, 0.7, 0.7)),
+    Region.SNOW_PLAINS: ((0.48, 0.6, 0.58), (0.62, 0.84, 0.81), (0.94, 1, 0.99)),
+}
+# objects have one colour, in the order of their region values (5, 6, ...)
+OBJECT_COLORS = (
+    (0.1, 0.6, 0.5), # bush
+    (0.1, 0.8, 0.5), # spruce
+    (0.1, 0.6, 0.5), # tree
+    (0.4, 0.4, 0.4), # rock
+    (0.8, 0.8, 0.8), # spruce (snowy)
+)
+
+def gradient_row(stops, width=PALETTE_WIDTH):
+    '''
+    colours evenly spread over the row, linearly mixed in between
+    '''
+    stops = np.array(stops, dtype=np.float32).reshape(-1, 3)
+    t = np.linspace(0, 1, width)
+    at = np.linspace(0, 1, len(stops))
+    return np.stack([np.interp(t, at, stops[:, c]) for c in range(3)], axis=1)
+
+def default_rows():
+    rows = [gradient_row(REGION_GRADIENTS[rg]) for rg in Region]
+    rows += [gradient_row(color) for color in OBJECT_COLORS]
+    return rows
+
+class Palette:
+    '''
+    RGB texture of rows x PALETTE_WIDTH texels, rows can be changed or
+    added while running, the shader reads the number of rows from the texture
+    '''
+    def __init__(self, rows=None):
+        self.rows = list(rows) if rows is not None else default_rows()
+        self.texture = glGenTextures(1)
+        glBindTexture(GL_TEXTURE_2D, self.texture)
+        # smooth along the height, rows are sampled at their centers
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_CLAMP_TO_EDGE)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_CLAMP_TO_EDGE)
+        self.upload()
+
+    def pixels(self):
+        data = np.clip(np.stack(self.rows), 0, 1)
+        return (data*255 + 0.5).astype(np.uint8)
+
+    def upload(self):
+        glBindTexture(GL_TEXTURE_2D, self.texture)
+        glPixelStorei(GL_UNPACK_ALIGNMENT, 1)
+        glTexImage2D(
+            GL_TEXTURE_2D, 0, GL_RGB8, PALETTE_WIDTH, len(self.rows), 0,
+            GL_RGB, GL_UNSIGNED_BYTE, self.pixels()
+        )
+
+    def set_row(self, row, stops):
+        '''
+        replaces the colours of a row, one colour or a gradient from low to high
+        a row past the end adds a new colour scheme
+        '''
+        colors = gradient_row(stops)
+        if row < len(self.rows):
+            self.rows[row] = colors
+            glBindTexture(GL_TEXTURE_2D, self.texture)
+            glPixelStorei(GL_UNPACK_ALIGNMENT, 1)
+            glTexSubImage2D(
+                GL_TEXTURE_2D, 0, 0, row, PALETTE_WIDTH, 1,
+                GL_RGB, GL_UNSIGNED_BYTE, self.pixels()[row]
+            )
+            return
+        # rows in between are black until they are set
+        while len(self.rows) < row:
+            self.rows.append(np.zeros((PALETTE_WIDTH, 3), dtype=np.float32))
+        self.rows.append(colors)
+        self.upload()
+
+    def bind(self):
+        glActiveTexture(GL_TEXTURE0 + PALETTE_UNIT)
+        glBindTexture(GL_TEXTURE_2D, self.texture)
+
+    def delete(self):
+        glDeleteTextures(1, [self.texture])
@@ -0,0 +1,99 @@
+'''
+Persistent on-disk cache of linked shader programs
+'''
+from OpenGL.GL import *
+from OpenGL.error import GLError
+
+import hashlib
+import os
+import struct
+import numpy as np
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "fsmt-gen", "shaders")
+# binary format enum in front of the driver blob
+HEADER = struct.Struct("<I")
+
+class ProgramCache:
+    '''
+    stores program binaries (glGetProgramBinary) named after the hash of the
+    shader sources and the driver, a driver update or an edited shader
+    simply misses the cache. Binaries the driver rejects are deleted and the
+    program is compiled from source again
+    '''
+    def __init__(self, path=DEFAULT_CACHE_DIR):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+
+    def supported(self):
+        return glGetIntegerv(GL_NUM_PROGRAM_BINARY_FORMATS) > 0
+
+    def key(self, *sources):
+        h = hashlib.sha1()
+        # only valid on the same driver, the strings are queried from the current context
+        for name in (GL_VENDOR, GL_RENDERER, GL_VERSION):
+            h.update(glGetString(name) or b"")
+        for src in sources:
+            h.update(src.encode())
+        return h.hexdigest()
+
+    def entry_path(self, key):
+        return os.path.join(self.path, f"{key}.bin")
+
+    def load(self, key):
+        '''
+        returns a linked program or None if there is no usable binary
+        '''
+        try:
+            with open(self.entry_path(key), 'rb') as f:
+                data = f.read()
+            fmt, = HEADER.unpack_from(data)
+        except (OSError, struct.error):
+            self.misses += 1
+            return None
+        program = glCreateProgram()
+        blob = np.frombuffer(data, dtype=np.uint8, offset=HEADER.size)
+        try:
+            # an unknown format is an INVALID_ENUM error instead of a failed link
+            glProgramBinary(program, fmt, blob, len(blob))
+            linked = glGetProgramiv(program, GL_LINK_STATUS)
+        except GLError:
+            linked = False
+        if not linked:
+            # driver changed in a way the key did not catch, or a broken file
+            glDeleteProgram(program)
+            self.forget(key)
+            self.misses += 1
+            return None
+        self.hits += 1
+        return program
+
+    def store(self, key, program):
+        length = glGetProgramiv(program, GL_PROGRAM_BINARY_LENGTH)
+        if not length:
+            return
+        blob = np.empty(length, dtype=np.uint8)
+        written = np.zeros(1, dtype=np.int32)
+        fmt = np.zeros(1, dtype=np.uint32)
+        glGetProgramBinary(program, length, written, fmt, blob)
+        path = self.entry_path(key)
+        tmp = f"{path}.tmp-{os.getpid()}"
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            with open(tmp, 'wb') as f:
+                f.write(HEADER.pack(int(fmt[0])))
+                f.write(blob[:int(written[0])].tobytes())
+            os.replace(tmp, path)
+        except OSError as e:
+            print('could not cache shader program: ', e)
+
+    def forget(self, key):
+        try:
+            os.remove(self.entry_path(key))
+        except OSError:
+            pass
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
+
+default_program_cache = ProgramCache()
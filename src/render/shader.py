@@ -1,10 +1,52 @@
 from OpenGL.GL import *
 
 from core.matrix_util import Matrix3D,Matrix4D
+from render.program_cache import default_program_cache
+import os
 import numpy as np
+
+SHADER_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "shaders"))
+
+# uniform block binding points, shared by every program that declares the block
+FRAME_BINDING = 0
+
+class FrameUniforms:
+    '''
+    std140 uniform buffer with the per-frame data of every shader:
+        layout(std140, binding = 0) uniform Frame { mat4 view; mat4 projection; float time; };
+    it is filled once per frame instead of setting uniforms per chunk
+    '''
+    # 2 mat4 + float, padded to a vec4
+    FLOATS = 16 + 16 + 4
+    def __init__(self, binding=FRAME_BINDING):
+        self.binding = binding
+        self.data = np.zeros(self.FLOATS, dtype=np.float32)
+        self.ubo = glGenBuffers(1)
+        glBindBuffer(GL_UNIFORM_BUFFER, self.ubo)
+        glBufferData(GL_UNIFORM_BUFFER, self.data.nbytes, None, GL_DYNAMIC_DRAW)
+        glBindBufferBase(GL_UNIFORM_BUFFER, binding, self.ubo)
+        glBindBuffer(GL_UNIFORM_BUFFER, 0)
+    def update(self, view:Matrix4D, projection:Matrix4D, time):
+        # std140 matrices are column major, like the ones GL expects
+        self.data[0:16] = view.data.ravel('F')
+        self.data[16:32] = projection.data.ravel('F')
+        self.data[32] = time
+        glBindBuffer(GL_UNIFORM_BUFFER, self.ubo)
+        glBufferSubData(GL_UNIFORM_BUFFER, 0, self.data.nbytes, self.data)
+        glBindBuffer(GL_UNIFORM_BUFFER, 0)
+    def delete(self):
+        glDeleteBuffers(1, [self.ubo])
+
 class Shader:
-    def __init__(self, vertex_path, fragment_path):
+    def __init__(self, vertex_path, fragment_path, cache=default_program_cache):
+        self.cache = cache # None compiles from source every time
         self.program = self.create_shader_program(vertex_path, fragment_path)
+        self.uniforms = {} # name => location, filled once after linking
+        self.cache_uniforms()
+    def delete(self):
+        glDeleteProgram(self.program)
+        self.program = 0
+        self.uniforms = {}
 
     def create_shader_program(self, vertex_path, fragment_path):
         with open(vertex_path, 'r') as f:
@@ -12,6 +54,13 @@ class Shader:
         with open(fragment_path, 'r') as f:
             fragment_src = f.read()
 
+        key = None
+        if self.cache is not None and self.cache.supported():
+            key = self.cache.key(vertex_src, fragment_src)
+            program = self.cache.load(key)
+            if program is not None:
+                return program
+
         vertex_shader = glCreateShader(GL_VERTEX_SHADER)
         glShaderSource(vertex_shader, vertex_src)
         glCompileShader(vertex_shader)
@@ -25,14 +74,42 @@ class Shader:
         shader_program = glCreateProgram()
         glAttachShader(shader_program, vertex_shader)
         glAttachShader(shader_program, fragment_shader)
+        if key is not None:
+            glProgramParameteri(shader_program, GL_PROGRAM_BINARY_RETRIEVABLE_HINT, GL_TRUE)
         glLinkProgram(shader_program)
-        self.check_compile_errors(shader_program, "PROGRAM")
+        linked = self.check_compile_errors(shader_program, "PROGRAM")
 
         glDeleteShader(vertex_shader)
         glDeleteShader(fragment_shader)
 
+        if key is not None and linked:
+            self.cache.store(key, shader_program)
+
         return shader_program
 
+    def cache_uniforms(self):
+        '''
+        looks up every active uniform once, and binds the Frame block if the program has one
+        '''
+        self.uniforms = {}
+        for i in range(glGetProgramiv(self.program, GL_ACTIVE_UNIFORMS)):
+            name = glGetActiveUniform(self.program, i)[0]
+            if isinstance(name, bytes):
+                name = name.decode()
+            name = name.split('[')[0]
+            loc = glGetUniformLocation(self.program, name)
+            if loc >= 0: # members of uniform blocks have no location
+                self.uniforms[name] = loc
+        block = glGetUniformBlockIndex(self.program, "Frame")
+        if block != GL_INVALID_INDEX:
+            glUniformBlockBinding(self.program, block, FRAME_BINDING)
+    def location(self, name):
+        loc = self.uniforms.get(name)
+        if loc is None:
+            # not active (optimized out or a typo), setting -1 is a no-op in GL
+            loc = self.uniforms[name] = glGetUniformLocation(self.program, name)
+        return loc
+
     def use(self):
         glUseProgram(self.program)
 
@@ -40,24 +117,24 @@ class Shader:
         glUseProgram(0)
 
     def set_mat4(self, name, matrix:Matrix4D):
-        loc = glGetUniformLocation(self.program, name)
+        loc = self.location(name)
         matrix_flattened = np.array(matrix.data, dtype=np.float32).flatten('F')
         glUniformMatrix4fv(loc, 1, GL_FALSE, matrix_flattened)
     def set_mat3(self, name, matrix: Matrix3D):
-        loc = glGetUniformLocation(self.program, name)
+        loc = self.location(name)
         matrix_flattened = np.array(matrix.data, dtype=np.float32).flatten('F')
         glUniformMatrix3fv(loc, 1, GL_FALSE, matrix_flattened)
     def set_vec3(self, name, x, y, z):
-        loc = glGetUniformLocation(self.program, name)
+        loc = self.location(name)
         glUniform3f(loc, x, y, z)
     def set_vec4(self, name, x, y, z, w):
-        loc = glGetUniformLocation(self.program, name)
+        loc = self.location(name)
         glUniform4f(loc, x, y, z, w)
     def set_float(self, name, value):
-        loc = glGetUniformLocation(self.program, name)
+        loc = self.location(name)
         glUniform1f(loc, value)
     def set_int(self, name, value):
-        loc = glGetUniformLocation(self.program, name)
+        loc = self.location(name)
         glUniform1i(loc, value)
     def check_compile_errors(self, shader, t):
         if t == "PROGRAM":
@@ -65,6 +142,7 @@ class Shader:
             if not success:
                 info = glGetProgramInfoLog(shader)
                 print(f"ERROR::SHADER::PROGRAM::LINKING_FAILED\n{info.decode()}")
+            return bool(success)
         else:
             success = glGetShaderiv(shader, GL_COMPILE_STATUS)
             if not success:
@@ -6,14 +6,26 @@ import os
 
 from core.enums import Region
 from core.terrain_gen import get_y
-from core.object_gen import can_place
+from core.object_gen import can_place, object_from_id
 from core.matrix_util import Vector3D,Vector4D,Matrix3D,Matrix4D
+from core.world_file import WorldFile, chunk_centers, save_world
+from core.region_gen import cell_hash
+from core.heightmap import Heightmap, HeightmapSource
+from core.tracing import span
 
 from render.object_manager import Object3D
+from render.mesh_worker import MeshWorkerPool
+from render.mesh_lod import BILLBOARD
+from render.memory_budget import MemoryBudget
+from render.occlusion import OcclusionCuller
+from render.frame_profiler import null_profiler
+from render.gpu_timer import GpuTimers
+from render.block_store import BlockStore, RISE_DEPTH, rise_offset
 
 from OpenGL.GL import *
 from OpenGL.GLU import *
 
+import math
 import random as rand
 import numpy as np
 import time
@@ -21,157 +33,275 @@ import time
 # sys.path.append(os.path.abspath(os.path.dirname(__file__)))
 
 BLOCK_SIZE = 2
+# longest ray used for picking, same as the camera far plane
+PICK_DISTANCE = 1000.0
 
-class Block:
-    def __init__(self, center_x, y, center_z, region: Region, obj=None):
-        self.center_x = center_x
-        self.y = y
-        self.k = 5 # change rate
-        self.curr_y = y-self.k
-        self.center_z = center_z
-        self.a = 0.1 # alpha
-        self.time_created = time.perf_counter()
-
-        self.region = region
-        self.obj = obj
-        
-        self.is_final = False
-        self.model_matrix = Matrix4D(
-            1, 0, 0, 0,
-            0, 1, 0, 0,
-            0, 0, 1, 0,
-            0, 0, 0, 1
-        )
-    def update(self):
-        if self.is_final:
-            return
-        s = self.k
-        diff = 0.003*((time.perf_counter()- self.time_created)**4)
-        self.curr_y += s * diff
-        if self.curr_y >= self.y:
-            self.curr_y = self.y
-            self.is_final = True
+# unit cube, y is scaled by the block height
+CUBE_CORNERS = np.array([
+    [-1,0,-1],
+    [1,0,-1],
+    [1,0,1],
+    [-1,0,1],
+
+    [-1,1,-1],
+    [1,1,-1],
+    [1,1,1],
+    [-1,1,1],
+], dtype=np.float32)
+CUBE_INDICES = np.array([
+    f[i]
+    for f in [(0, 1, 2, 3), (7, 6, 5, 4), (4, 5, 1, 0), (5, 6, 2, 1), (6, 7, 3, 2), (7, 4, 0, 3)]
+    for i in (0, 1, 2, 0, 2, 3)
+], dtype=np.uint32)
+# every terrain chunk is drawn from one shared index buffer with this many cubes
+MAX_CHUNK_BLOCKS = 9
+CUBE_INDEX_TYPE = (np.uint16, GL_UNSIGNED_SHORT) if 8*MAX_CHUNK_BLOCKS <= 0xffff else (np.uint32, GL_UNSIGNED_INT)
+
+def cube_indices(n):
+    '''
+    index pattern of n cubes whose 8 corners follow each other in the vertex buffer
+    '''
+    return (CUBE_INDICES[None, :] + 8*np.arange(n, dtype=np.uint32)[:, None]).ravel()
+
+def init_gl_state():
+    '''
+    fixed GL state the world is drawn with, call once after creating the context
+    '''
+    glClearColor(0.4, 0.7, 1.0, 1.0) #temp color
+    glEnable(GL_CULL_FACE)
+    glEnable(GL_BLEND)
+    glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
+    glFrontFace(GL_CCW)
+    glCullFace(GL_BACK)
+    glEnable(GL_DEPTH_TEST)
+
+def lod_level(dist, thresholds, current, hysteresis):
+    '''
+    number of thresholds below dist, but the current level is kept
+    until dist is clearly past the threshold that separates them
+    '''
+    level = sum(dist > t for t in thresholds)
+    if level > current and dist <= thresholds[current]*(1+hysteresis):
+        return current
+    if level < current and dist >= thresholds[current-1]*(1-hysteresis):
+        return current
+    return level
+
+def box_mesh(xs, zs, half, ys, times, regions, selected, half_z=None):
+    '''
+    vertex array of columns standing on y=0, drawn with cube_indices
+    every argument except half and half_z is an array with one value per column,
+    columns are half_z (default half) deep
+    '''
+    n = len(xs)
+    if half_z is None:
+        half_z = half
+    # 4:x,4:y,4:z,4:time_created,4:region,4:is_selected,4:y_level
+    v_list = np.empty((n, 8, 7), dtype=np.float32)
+    v_list[:, :, 0] = xs[:, None] + half*CUBE_CORNERS[:, 0]
+    v_list[:, :, 1] = ys[:, None] * CUBE_CORNERS[:, 1]
+    v_list[:, :, 2] = zs[:, None] + half_z*CUBE_CORNERS[:, 2]
+    v_list[:, :, 3] = times[:, None]
+    v_list[:, :, 4] = regions[:, None]
+    v_list[:, :, 5] = selected[:, None]
+    v_list[:, :, 6] = (ys + 0.1)[:, None]
+    return v_list.ravel()
 
 class Chunk:
-    def __init__(self,y_data,rg_data,obj_data, center_x=0, center_z=0):
-        self.blocks = []
+    def __init__(self,y_data,rg_data,obj_data, center_x=0, center_z=0, store=None, now=None):
         #block size
         size = BLOCK_SIZE
         self.state = GL_DYNAMIC_DRAW
+        self.center_x = center_x
+        self.center_z = center_z
 
-        self.k = 5 # Block.y_0 = Block.y - k
-        self.time_created = time.perf_counter()
+        self.k = RISE_DEPTH # Block.y_0 = Block.y - k
+        # on the clock of the world, the shader compares it with the frame time
+        self.time_created = time.perf_counter() if now is None else now
 
+        # only the handles and sizes are kept after an upload
         self.vao = None
         self.vbo = None
-        self.ebo = None
-        self.v_list = []
-        self.i_list = []
-        self.v_count = 0
+        self.i_count = 0 # indices of the shared cube index buffer
 
         # obj
         self.o_vao = None
         self.o_vbo = None
         self.o_ebo = None
-        self.o_v_list = []
-        self.o_i_list = []
-        self.o_v_count = 0
+        self.o_i_count = 0
+
+        self.gpu_bytes = 0
+        # bounding box for occlusion queries, top is set on upload
+        self.half_width = 1 + BLOCK_SIZE
+        self.top = 0.0
+        self.query = None
+        self.query_issued = False
+        self.occluded = False
 
         self.world = None
         self.not_final = True
         self.selected = False
-        #every chunk has 9 blocks
-        for dx in [-1, 0, 1]:
-            for dz in [-1, 0, 1]:
-                x = center_x + dx * size
-                z = center_z + dz * size
-                y = y_data[(x,z)]
-                rg = rg_data[(x,z)]
-                obj = obj_data[(x,z)]
-                block = Block(x, y, z, rg, obj)
-                self.blocks.append(block)
-        self.rebuild()
+        self.pending = False # waiting for a mesh worker
+        self.released = False
+        # 0 - every block, 1 - one column for the whole chunk,
+        # 2, 3 ... - one column for a group of 2x2, 4x4 ... chunks, drawn by the corner chunk
+        self.lod = 0
+        self.obj_lod = 0 # object LOD of the chunk center, the objects pick their own
+        #every chunk has 9 blocks, they live in the store as block ids [block_start, block_stop)
+        self.store = store if store is not None else BlockStore(9)
+        keys = [
+            (center_x + dx * size, center_z + dz * size)
+            for dx in [-1, 0, 1] for dz in [-1, 0, 1]
+        ]
+        self.block_start, self.block_stop = self.store.add(
+            [x for x, _ in keys], [z for _, z in keys],
+            [y_data[key] for key in keys], [rg_data[key] for key in keys],
+            # the data only has model ids, the objects belong to this world
+            [object_from_id(obj_data[key], key[0], y_data[key], key[1]) for key in keys],
+            self.time_created
+        )
 
     def get_v_color(self, y):
         '''
         DEPRECATED
         '''
         return [0.5, (y/30), 0.5] #temp
-    def render_block(self,block:Block):
-        x,z = block.center_x,block.center_z
-        y = block.y - self.k
-        v_list = [
-            [x-1,0,z-1],
-            [x+1,0,z-1],
-            [x+1,0,z+1],
-            [x-1,0,z+1],
-            
-            [x-1,y,z-1],
-            [x+1,y,z-1],
-            [x+1,y,z+1],
-            [x-1,y,z+1],
-        ]
-        f_list = [
-            (0, 1, 2, 3),  
-            (7, 6, 5, 4),  
-            (4, 5, 1, 0),  
-            (5, 6, 2, 1),  
-            (6, 7, 3, 2),  
-            (7, 4, 0, 3)   
-        ]
-        is_selected=0.1
-        if self.world is not None \
-        and self.world.selected_block is not None \
-        and (self.world.selected_block.center_x==block.center_x and self.world.selected_block.center_z==block.center_z):
-            is_selected=1.0
-        info = [block.time_created,block.region.value,is_selected,y+0.1]
-        for v in v_list:
-            self.v_list.extend(v+info)
-            # self.v_list.extend(v+v_c)
-        for f in f_list:
-            self.i_list.extend(
-                [
-                    self.v_count + f[0],
-                    self.v_count + f[1],
-                    self.v_count + f[2],
-                    self.v_count + f[0],
-                    self.v_count + f[2],
-                    self.v_count + f[3],
-                ]
+    def is_selected(self, block_id):
+        return self.world is not None and self.world.selected_block == block_id
+    def mesh_state(self):
+        '''
+        everything the mesh depends on, taken on the GL thread when a rebuild
+        is submitted, so a worker never reads it while it changes
+        the blocks are copied out of the store, a worker never sees its arrays
+        returns (k, lod, selected block in the chunk or None, focus, blocks, group)
+        group is (column, is_anchor) for lod >= 2, see World.group_column
+        '''
+        world = self.world
+        selected = None
+        focus = None
+        group = None
+        if world is not None:
+            if world.selected_block is not None and self.block_start <= world.selected_block < self.block_stop:
+                selected = world.selected_block - self.block_start
+            focus = tuple(world.focus_pos)
+            if self.lod >= 2:
+                group = world.group_column(self)
+        blocks = self.store.snapshot(self.block_start, self.block_stop)
+        return self.k, self.lod, selected, focus, blocks, group
+    def build_mesh(self, state=None):
+        '''
+        builds vertex and index arrays of the chunk and its objects
+        does not touch OpenGL or change anything shared, so it is safe to call
+        from a worker thread with a state from mesh_state()
+        returns (v_list, i_count, o_v_list, o_i_list), terrain has no index
+        array of its own, it uses the first i_count shared cube indices
+        '''
+        k, lod, selected_i, focus, blocks, group = self.mesh_state() if state is None else state
+        center_x, center_z, y, time_created, region, objects = blocks
+        n = len(center_x)
+        xs = center_x.astype(np.float32)
+        zs = center_z.astype(np.float32)
+        ys = y - np.float32(k)
+        times = time_created.astype(np.float32)
+        regions = region.astype(np.float32)
+        selected = np.full(n, 0.1, dtype=np.float32)
+        if selected_i is not None:
+            selected[selected_i] = 1.0
+
+        if lod == 0:
+            v_list = box_mesh(xs, zs, 1.0, ys, times, regions, selected)
+        elif group is not None:
+            # the group is one column drawn by its anchor, the others only draw their objects
+            (x0, z0, x1, z1, top, dominant, time_created), is_anchor = group
+            v_list = np.empty(0, dtype=np.float32)
+            if is_anchor:
+                v_list = box_mesh(
+                    np.array([(x0+x1)/2], dtype=np.float32),
+                    np.array([(z0+z1)/2], dtype=np.float32),
+                    (x1-x0)/2,
+                    np.array([top], dtype=np.float32),
+                    np.array([time_created], dtype=np.float32),
+                    np.array([dominant], dtype=np.float32),
+                    np.array([0.1], dtype=np.float32),
+                    half_z=(z1-z0)/2,
+                )
+            ys = np.full(n, top, dtype=np.float32)
+        else:
+            # the whole chunk becomes one column: highest block, dominant region
+            # columns reach down to y=0, so their walls hide seams between levels
+            top = ys.max()
+            dominant = np.bincount(regions.astype(np.int64)).argmax()
+            v_list = box_mesh(
+                np.array([self.center_x], dtype=np.float32),
+                np.array([self.center_z], dtype=np.float32),
+                1.0 + BLOCK_SIZE,
+                np.array([top], dtype=np.float32),
+                np.array([times.min()], dtype=np.float32),
+                np.array([dominant], dtype=np.float32),
+                np.array([selected.max()], dtype=np.float32),
             )
+            # objects stand on the merged column
+            ys = np.full(n, top, dtype=np.float32)
 
-        self.v_count+=8
-        if block.obj is not None:
-            if not block.is_final:
-                dy = y - block.obj.y
-                block.obj.translate(0,dy,0)
-            o_v,o_vlist,o_ilist = block.obj.get_mesh(self.o_v_count,info)
-            self.o_v_count+=o_v
-            self.o_i_list.extend(o_ilist)
-            self.o_v_list.extend(o_vlist)
-    def rebuild(self):
-        if self.k>0:
-            diff = 0.003*((time.perf_counter()- self.time_created)**4)
-            self.k-=diff
-            if self.k < 0:
-                self.k = 0
-        self.v_list = []
-        self.i_list = []
-        self.v_count = 0
-
-        self.o_v_list = []
-        self.o_i_list = []
-        self.o_v_count = 0
-        for block in self.blocks:
-            self.render_block(block)
-            if block.is_final and self.not_final:
-                self.not_final = False
-        self.send_gpu()
-    def send_gpu(self):
+        o_v_lists = []
+        o_i_lists = []
+        o_v_count = 0
+        for i, obj in enumerate(objects):
+            if obj is None:
+                continue
+            x, z = int(xs[i]), int(zs[i])
+            y = float(ys[i])
+            obj_lod = 0
+            if focus is not None:
+                d = math.dist(focus, (x, y, z))
+                # far away, only every few objects are kept (always the same ones)
+                if d > self.world.OBJECT_THIN_DISTANCE \
+                   and cell_hash(x, z) % self.world.OBJECT_THIN_KEEP:
+                    continue
+                obj_lod = min(BILLBOARD, sum(d > t for t in self.world.OBJECT_LOD_DISTANCES))
+            # keep the object on top of its (rising) block, the shared object is not moved
+            info = [float(times[i]),float(regions[i]),float(selected[i]),y+0.1]
+            o_v,o_vlist,o_ilist = obj.get_mesh(o_v_count,info,obj_lod,dy=y-obj.y)
+            o_v_count+=o_v
+            o_v_lists.append(o_vlist)
+            o_i_lists.append(o_ilist)
+        o_v_list = np.concatenate(o_v_lists) if o_v_lists else np.empty(0, dtype=np.float32)
+        o_i_list = np.concatenate(o_i_lists) if o_i_lists else np.empty(0, dtype=np.uint32)
+        return v_list, len(v_list)//(8*7)*len(CUBE_INDICES), o_v_list, o_i_list
+    def tick(self, now):
+        '''
+        moves the rising animation of the chunk to the time now
+        returns True if the mesh has to be rebuilt
+        '''
+        k = float(rise_offset(now - self.time_created))
+        changed = k != self.k
+        self.k = k
+        if self.not_final and self.store.all_final(self.block_start, self.block_stop):
+            self.not_final = False
+        return changed
+    def rebuild(self, now=None):
+        '''
+        synchronous rebuild, only call from the GL thread
+        '''
+        self.tick(time.perf_counter() if now is None else now)
+        self.send_gpu(self.build_mesh())
+    def cpu_bytes(self):
+        '''
+        rough size of the blocks of the chunk in the store, only reported,
+        the budget never evicts CPU data (streaming unloads far chunks instead)
+        '''
+        return (self.block_stop - self.block_start)*BlockStore.BYTES_PER_BLOCK
+    def send_gpu(self, mesh):
+        self.pending = False
+        v_list, i_count, o_v_list, o_i_list = mesh
+        self.i_count = i_count
+        self.o_i_count = len(o_i_list)
+        self.gpu_bytes = v_list.nbytes + o_v_list.nbytes + o_i_list.nbytes
+        # y of every vertex, objects included
+        self.top = float(max(v_list[1::7].max(initial=0), o_v_list[1::7].max(initial=0)))
         if self.vao is None:
             self.vao = glGenVertexArrays(1)
             self.vbo = glGenBuffers(1)
-            self.ebo = glGenBuffers(1)
 
             self.o_vao = glGenVertexArrays(1)
             self.o_vbo = glGenBuffers(1)
@@ -179,11 +309,9 @@ class Chunk:
 
         glBindVertexArray(self.vao)
         glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
-        vlist_np = np.array(self.v_list, dtype=np.float32)
-        glBufferData(GL_ARRAY_BUFFER, vlist_np.nbytes, vlist_np, self.state)
-        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.ebo)
-        ilist_np = np.array(self.i_list, dtype=np.uint32)
-        glBufferData(GL_ELEMENT_ARRAY_BUFFER, ilist_np.nbytes, ilist_np, self.state)
+        glBufferData(GL_ARRAY_BUFFER, v_list.nbytes, v_list, self.state)
+        # the VAO remembers the shared index buffer, nothing is uploaded for it
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.world.cube_index_buffer())
 
         # koroche
         # 4:x,4:y,4:z,4:time_created,4:region,4:is_selected
@@ -204,11 +332,9 @@ class Chunk:
         # obj
         glBindVertexArray(self.o_vao)
         glBindBuffer(GL_ARRAY_BUFFER, self.o_vbo)
-        vlist_np = np.array(self.o_v_list, dtype=np.float32)
-        glBufferData(GL_ARRAY_BUFFER, vlist_np.nbytes, vlist_np, self.state)
+        glBufferData(GL_ARRAY_BUFFER, o_v_list.nbytes, o_v_list, self.state)
         glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.o_ebo)
-        ilist_np = np.array(self.o_i_list, dtype=np.uint32)
-        glBufferData(GL_ELEMENT_ARRAY_BUFFER, ilist_np.nbytes, ilist_np, self.state)
+        glBufferData(GL_ELEMENT_ARRAY_BUFFER, o_i_list.nbytes, o_i_list, self.state)
 
         glVertexAttribPointer(0, 3, GL_FLOAT, GL_FALSE, 28, ctypes.c_void_p(0))
         glEnableVertexAttribArray(0)
@@ -223,143 +349,700 @@ class Chunk:
 
         glBindVertexArray(0)
     
+    def free_gpu(self):
+        '''
+        frees the GPU buffers, the chunk is uploaded again when it gets rebuilt
+        '''
+        if self.vao is None:
+            return
+        glDeleteVertexArrays(2, [self.vao, self.o_vao])
+        glDeleteBuffers(3, [self.vbo, self.o_vbo, self.o_ebo])
+        self.vao = self.vbo = None
+        self.o_vao = self.o_vbo = self.o_ebo = None
+        if self.query is not None:
+            glDeleteQueries(1, [self.query])
+            self.query = None
+            self.query_issued = False
+        self.i_count = self.o_i_count = 0
+        self.gpu_bytes = 0
+    def release(self):
+        '''
+        frees the GPU buffers and the blocks, the chunk cannot be drawn afterwards
+        '''
+        self.released = True
+        self.free_gpu()
+        self.store.remove(self.block_start, self.block_stop)
     def render(self, shader):
-        model_matrix = Matrix4D(
-            1, 0, 0, 0,
-            0, 1, 0, 0,
-            0, 0, 1, 0,
-            0, 0, 0, 1
-        )
-        shader.set_mat4("model", model_matrix)
-        shader.set_float("time", time.perf_counter())
+        if self.vao is None:
+            return
+        self.render_terrain()
+        self.render_objects()
+        glBindVertexArray(0)
+    def render_terrain(self):
+        # chunks are in world space, camera and time come from the Frame uniform block
         glBindVertexArray(self.vao)
         # glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
-        # glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.ebo)
-        glDrawElements(GL_TRIANGLES, len(self.i_list), GL_UNSIGNED_INT, None)
-        
+        glDrawElementsBaseVertex(GL_TRIANGLES, self.i_count, CUBE_INDEX_TYPE[1], None, 0)
+    def render_objects(self):
         glBindVertexArray(self.o_vao)
         # glBindBuffer(GL_ARRAY_BUFFER, self.o_vbo)
         # glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.o_ebo)
-        glDrawElements(GL_TRIANGLES, len(self.o_i_list), GL_UNSIGNED_INT, None)
-        glBindVertexArray(0)
+        glDrawElements(GL_TRIANGLES, self.o_i_count, GL_UNSIGNED_INT, None)
 
 
 class World:
-    def __init__(self, y_info,rg_info,obj_info, seed=1,shader=None, n_rings=10, generation_rate=2, obj_intensity=0.5, height_intensity=0.5): #generation_rate is measured in ticks
+    # finished meshes uploaded per frame, the rest wait for the next frames
+    MAX_UPLOADS_PER_FRAME = 8
+    # streaming worlds
+    STREAM_CHUNKS_PER_TICK = 2
+    PREFETCH_TIME = 1.0 # seconds of camera movement to look ahead
+    FILE_LOAD_RADIUS = 48 # world files only decode the chunks this close to the camera
+    # terrain level of detail
+    LOD_DISTANCE = 60 # chunks further than this are drawn as single columns
+    # groups of 2x2, 4x4, 8x8 chunks further than these are drawn as single columns
+    LOD_GROUP_DISTANCES = (90, 130, 190)
+    LOD_HYSTERESIS = 0.15 # fraction of the LOD distances to avoid flickering at the border
+    # object level of detail, the last level is a billboard
+    OBJECT_LOD_DISTANCES = (25, 50, 90)
+    OBJECT_THIN_DISTANCE = 120 # objects further than this are thinned out
+    OBJECT_THIN_KEEP = 3 # one out of this many objects is kept when thinning
+    # bounding sphere of a chunk for visibility checks
+    CHUNK_MID_HEIGHT = 20
+    CHUNK_RADIUS = 32
+    # seconds a new chunk takes to fade in, same as in world_f.frag
+    FADE_TIME = 1.5
+    TICK_RATE = 20 # step() calls per second
+    # objects of finished chunks hidden behind terrain are skipped by the GPU
+    OCCLUSION_QUERIES = True
+    def __init__(self, y_info,rg_info,obj_info, seed=1,shader=None, n_rings=10, generation_rate=2, obj_intensity=0.5, height_intensity=0.5, mesh_workers=None, source=None, streaming=False, gpu_limit=256*1024*1024): #generation_rate is measured in ticks
         self.seed = seed
+        self.obj_intensity = obj_intensity
+        self.height_intensity = height_intensity
         self.shader = shader
         if n_rings < 1:
             raise ValueError("Number of rings cannot be less than 1")
         self.n_rings = n_rings
         # self.shader = shader
-        self.last_tick = time.perf_counter()
+        # animation, fading and the shader time all use this clock, headless
+        # benchmarks replace it with a simulated one before loading chunks
+        self.clock = time.perf_counter
+        self.last_tick = self.clock()
         self.ticks_elapsed = 1
         self.rate = generation_rate
         if generation_rate < 1:
             raise ValueError("Generation rate cannot be less than 1")
 
         self.chunk_scheduled = []
+        self.loading = set() # chunks whose data is being read or generated by a worker
         self.dynamic_chunks = []
         self.chunk_list = []
+        self.chunk_map = {} # (center_x, center_z) => Chunk
         # self.view_type = ObjectViewType.DEFAULT
 
         self.y_info = y_info
         self.rg_info = rg_info
         self.obj_info = obj_info
+        # anything with chunk_data(x, z), used instead of the dicts above
+        self.source = source
 
+        # streaming: chunks are loaded within load_radius of the camera
+        # and dropped once they are further than unload_radius
+        self.streaming = streaming
+        if streaming and source is None:
+            raise ValueError("Streaming worlds need a chunk source")
+        self.load_radius = 6*n_rings
+        self.unload_radius = self.load_radius + 12
+        self.focus_pos = [0, 0, 0]
+        self.focus_time = None
+        self.velocity = [0, 0, 0]
+        self.view_dir = None
+        self.fov = None
+        self.view_angle = None # half-angle of the view frustum diagonal, in degrees
+
+        # chunks that stay out of view give up their buffers when over the limit
+        self.budget = MemoryBudget(gpu_limit)
+        self.frame = 0
+
+        # every block of every chunk lives in the store, selected_block is a block id
+        self.store = BlockStore()
         self.selected_block = None
         self.selected_chunk = None
         self.prev_selected_chunk = None # saving it so deselection is possible
-    def generate_mesh(self):
+        self.needs_rebuild = set() # chunks whose mesh changed (rising, LOD, selection highlight)
+        self.far_groups = set() # (level, anchor) of the LOD groups drawn as one column
+
+        self.mesh_pool = MeshWorkerPool(mesh_workers)
+        self.cube_ebo = None # shared by every terrain chunk, created on the GL thread
+        self.occlusion = None # created on the GL thread with the first frame
+        self.profiler = null_profiler # set by whoever draws the world to time its phases
+        self.gpu_timers = None # GPU time of the draw passes, only queried while profiling
+    @classmethod
+    def from_file(cls, path, shader=None, generation_rate=2, mesh_workers=None, streaming=False):
+        '''
+        opens a world saved with World.save, chunks are read from the file on demand
+        streaming worlds only load the chunks within FILE_LOAD_RADIUS of the
+        camera and follow it, the others are never decoded
+        '''
+        world_file = WorldFile(path)
+        world = cls(
+            {},{},{},world_file.seed,shader,n_rings=world_file.n_rings,generation_rate=generation_rate,
+            obj_intensity=world_file.obj_intensity,height_intensity=world_file.height_intensity,
+            mesh_workers=mesh_workers,source=world_file,streaming=streaming
+        )
+        world.load_radius = min(world.load_radius, cls.FILE_LOAD_RADIUS)
+        world.unload_radius = world.load_radius + 12
+        return world
+    @classmethod
+    def from_heightmap(cls, path, shader=None, seed=1, obj_intensity=0.05, generation_rate=2, n_rings=None, streaming=False, mesh_workers=None):
+        '''
+        builds a world on an imported heightmap (.npy or raw, see core.heightmap)
+        bounded worlds get as many rings as fit into the heightmap by default
+        '''
+        heightmap = Heightmap.open(path)
+        if n_rings is None:
+            n_rings = heightmap.max_rings()
+        return cls(
+            {},{},{},seed,shader,n_rings=n_rings,generation_rate=generation_rate,
+            obj_intensity=obj_intensity,mesh_workers=mesh_workers,
+            source=HeightmapSource(heightmap,seed,obj_intensity),streaming=streaming
+        )
+    def save(self, path, compress=True):
+        if self.source is not None:
+            raise ValueError("Only generated worlds can be saved")
+        save_world(
+            path,self.seed,self.n_rings,self.obj_intensity,self.height_intensity,
+            self.rg_info,self.y_info,self.obj_info,compress=compress
+        )
+    def generate_mesh(self, center=None, radius=None):
         '''
         Generates a list of chunks to implement
+        file backed worlds schedule the chunks closest to center first
+        and skip the ones further than radius
+        '''
+        if self.streaming:
+            return # chunks are scheduled around the camera by update_streaming
+        if self.source is not None and center is not None:
+            self.chunk_scheduled.extend(self.source.chunks_near(center[0], center[2], radius))
+            return
+        self.chunk_scheduled.extend(chunk_centers(self.n_rings))
+    def chunk_data(self, x, z):
         '''
-        self.chunk_scheduled.append((0,0))
-        curr_ring = 1
-        while curr_ring < self.n_rings:
-            r = 6*curr_ring
-            for x in range(-r,r+1,6):
-                self.chunk_scheduled.append((x, r))
-                self.chunk_scheduled.append((x, -r))
-            for z in range(-r+6,r-5,6):
-                self.chunk_scheduled.append((r, z))
-                self.chunk_scheduled.append((-r, z))
-            curr_ring+=1
+        returns (y_data, rg_data, obj_data) that contain the blocks of the chunk at (x, z)
+        '''
+        if self.source is not None:
+            return self.source.chunk_data(x, z)
+        return self.y_info,self.rg_info,self.obj_info
     def update(self):
+        '''
+        advances the rising animation, chunks that moved get rebuilt with the next frame
+        '''
+        now = self.clock()
+        self.store.update(now)
         to_remove = []
         for chunk in self.dynamic_chunks:
-            if chunk.k<=0.1:
+            if chunk.tick(now):
+                self.needs_rebuild.add(chunk)
+                self.group_changed(chunk)
+            if chunk.k <= 0:
                 chunk.state = GL_STATIC_DRAW
                 to_remove.append(chunk)
-            chunk.rebuild()
         for chunk in to_remove:
             self.dynamic_chunks.remove(chunk)
     def generate_chunk(self):
+        '''
+        starts the next scheduled chunk, the data of source backed worlds is
+        generated or read on the workers and added later by add_loaded
+        '''
         if not self.chunk_scheduled:
             return
         x,z=self.chunk_scheduled.pop(0)
-        chunk = Chunk(self.y_info,self.rg_info,self.obj_info,center_x=x, center_z=z)
+        if (x,z) in self.chunk_map or (x,z) in self.loading:
+            return
+        if self.source is not None:
+            self.loading.add((x,z))
+            self.mesh_pool.load((x,z), self.source.chunk_data)
+            return
+        self.add_chunk(x, z, self.chunk_data(x, z))
+    def add_loaded(self):
+        '''
+        turns the chunk data finished by the workers into chunks, must run on the GL thread
+        '''
+        far = self.unload_radius**2
+        x, z = self.focus_pos[0], self.focus_pos[2]
+        for key, data in self.mesh_pool.drain_loaded():
+            self.loading.discard(key)
+            if data is None or key in self.chunk_map:
+                continue
+            if self.streaming and (key[0]-x)**2 + (key[1]-z)**2 > far:
+                continue # the camera moved away while it was loading
+            self.add_chunk(key[0], key[1], data)
+    def add_chunk(self, x, z, data):
+        with span("add_chunk", "chunk", x=x, z=z):
+            chunk = Chunk(*data,center_x=x, center_z=z, store=self.store, now=self.clock())
         chunk.world = self
+        chunk.lod = self.target_lod(chunk)
+        chunk.obj_lod = self.target_obj_lod(chunk)
         self.chunk_list.append(chunk)
+        self.chunk_map[(x,z)] = chunk
         self.dynamic_chunks.append(chunk)
+        self.mesh_pool.submit(chunk)
+        self.group_changed(chunk)
+    def unload_chunk(self, chunk):
+        '''
+        drops the chunk together with its GPU buffers
+        '''
+        chunk.release()
+        self.budget.forget(chunk)
+        self.chunk_list.remove(chunk)
+        del self.chunk_map[(chunk.center_x, chunk.center_z)]
+        if chunk in self.dynamic_chunks:
+            self.dynamic_chunks.remove(chunk)
+        self.needs_rebuild.discard(chunk)
+        if self.selected_chunk is chunk:
+            self.selected_chunk = None
+            self.selected_block = None
+        if self.prev_selected_chunk is chunk:
+            self.prev_selected_chunk = None
+        self.group_changed(chunk)
+    def set_focus(self, pos, view_dir=None, fov=None, aspect=1.0):
+        '''
+        tells the world where the camera is, streaming worlds load chunks around it
+        with a view direction and (vertical) fov, chunks out of view are not drawn
+        '''
+        self.view_dir = view_dir
+        self.fov = fov
+        if fov is not None:
+            # the corners of the screen are the furthest from the view direction
+            tan_half = math.tan(math.radians(fov/2))
+            self.view_angle = math.degrees(math.atan(tan_half*math.sqrt(1 + aspect*aspect)))
+        now = self.clock()
+        if self.focus_time is not None and now > self.focus_time:
+            dt = now - self.focus_time
+            # smoothed, so a single jittery frame does not move the prefetch area
+            self.velocity = [
+                0.8*self.velocity[i] + 0.2*(pos[i]-self.focus_pos[i])/dt
+                for i in range(3)
+            ]
+        self.focus_pos = list(pos)
+        self.focus_time = now
+    def is_visible(self, chunk):
+        '''
+        cone test of the chunk bounding sphere against the view direction,
+        the cone goes through the corners of the view so nothing on screen gets dropped
+        '''
+        if self.view_dir is None or self.view_angle is None:
+            return True
+        x, z, radius = chunk.center_x, chunk.center_z, self.CHUNK_RADIUS
+        if chunk.lod >= 2:
+            # the sphere has to hold the whole group, the anchor is in its corner
+            _, g = self.lod_group(x, z, chunk.lod)
+            half = 1.5*BLOCK_SIZE*(g-1)
+            x, z = x + half, z + half
+            radius += half*math.sqrt(2)
+        dx = x - self.focus_pos[0]
+        dy = self.CHUNK_MID_HEIGHT - self.focus_pos[1]
+        dz = z - self.focus_pos[2]
+        d = math.sqrt(dx*dx + dy*dy + dz*dz)
+        if d <= radius:
+            return True
+        cos_a = (dx*self.view_dir[0] + dy*self.view_dir[1] + dz*self.view_dir[2]) / d
+        angle = math.degrees(math.acos(max(-1.0, min(1.0, cos_a))))
+        return angle <= self.view_angle + math.degrees(math.asin(radius / d))
+    def chunks_around(self, x, z, radius):
+        '''
+        chunk centers within radius of (x, z), closest first
+        '''
+        step = 6
+        x0, x1 = int((x-radius)//step), int((x+radius)//step)+1
+        z0, z1 = int((z-radius)//step), int((z+radius)//step)+1
+        centers = []
+        for i in range(x0, x1+1):
+            for j in range(z0, z1+1):
+                d = (i*step-x)**2 + (j*step-z)**2
+                if d <= radius*radius:
+                    centers.append((d, (i*step, j*step)))
+        centers.sort()
+        return [c for _, c in centers]
+    def update_streaming(self):
+        '''
+        unloads far away chunks and schedules the missing ones around the camera,
+        followed by the ones the camera is moving towards
+        '''
+        x, z = self.focus_pos[0], self.focus_pos[2]
+        far = self.unload_radius**2
+        for (cx, cz), chunk in list(self.chunk_map.items()):
+            if (cx-x)**2 + (cz-z)**2 > far:
+                self.unload_chunk(chunk)
+
+        px = x + self.velocity[0]*self.PREFETCH_TIME
+        pz = z + self.velocity[2]*self.PREFETCH_TIME
+        prefetch = [
+            c for c in self.chunks_around(px, pz, self.load_radius)
+            if (c[0]-x)**2 + (c[1]-z)**2 <= far
+        ]
+        # bounded sources (world files) only have some of the chunks
+        has_chunk = getattr(self.source, 'has_chunk', None)
+        scheduled = {}
+        for c in self.chunks_around(x, z, self.load_radius) + prefetch:
+            if c in self.chunk_map or c in self.loading:
+                continue
+            if has_chunk is None or has_chunk(*c):
+                scheduled[c] = None
+        self.chunk_scheduled = list(scheduled)
+    def target_lod(self, chunk):
+        '''
+        level of detail of a chunk from its distance to the camera,
+        a chunk only switches once it is clearly past LOD_DISTANCE,
+        levels >= 2 are decided for the whole group at once
+        '''
+        if chunk is self.selected_chunk:
+            return 0
+        for level in range(len(self.LOD_GROUP_DISTANCES)+1, 1, -1):
+            if self.group_far(chunk, level):
+                return level
+        return lod_level(self.chunk_distance(chunk), (self.LOD_DISTANCE,), min(chunk.lod, 1), self.LOD_HYSTERESIS)
+    def lod_group(self, x, z, level):
+        '''
+        (anchor, size) of the group of the chunk at (x, z) on a level >= 2,
+        groups are aligned squares of size x size chunks, the anchor is the
+        center of the chunk in their lowest corner
+        '''
+        size = 2**(level-1)
+        step = 3*BLOCK_SIZE
+        return ((x//step)//size*size*step, (z//step)//size*size*step), size
+    def group_far(self, chunk, level):
+        '''
+        whether the group of the chunk is drawn as one column on this level,
+        the hysteresis is kept per group so its chunks always agree
+        '''
+        anchor, size = self.lod_group(chunk.center_x, chunk.center_z, level)
+        key = (level, anchor)
+        selected = self.selected_chunk
+        if anchor not in self.chunk_map or (
+            selected is not None and self.lod_group(selected.center_x, selected.center_z, level)[0] == anchor
+        ):
+            # nobody to draw the column, or a block in it is selected
+            self.far_groups.discard(key)
+            return False
+        half = 1.5*BLOCK_SIZE*(size-1)
+        x, y, z = self.focus_pos
+        d = math.sqrt((anchor[0]+half-x)**2 + y*y + (anchor[1]+half-z)**2)
+        limit = self.LOD_GROUP_DISTANCES[level-2]
+        if key in self.far_groups:
+            far = d >= limit*(1-self.LOD_HYSTERESIS)
+        else:
+            far = d > limit*(1+self.LOD_HYSTERESIS)
+        if far:
+            self.far_groups.add(key)
+        else:
+            self.far_groups.discard(key)
+        return far
+    def group_column(self, chunk):
+        '''
+        the column of the group of a chunk with lod >= 2, taken on the GL thread
+        returns ((x0, z0, x1, z1, top, region, time_created), is_anchor),
+        the column covers the loaded chunks of the group
+        '''
+        anchor, size = self.lod_group(chunk.center_x, chunk.center_z, chunk.lod)
+        step = 3*BLOCK_SIZE
+        members = [
+            self.chunk_map[key] for key in (
+                (anchor[0]+i*step, anchor[1]+j*step) for i in range(size) for j in range(size)
+            ) if key in self.chunk_map
+        ]
+        store = self.store
+        half = step/2
+        top = max(float(store.y[m.block_start:m.block_stop].max()) - m.k for m in members)
+        regions = np.concatenate([store.region[m.block_start:m.block_stop] for m in members])
+        column = (
+            min(m.center_x for m in members) - half, min(m.center_z for m in members) - half,
+            max(m.center_x for m in members) + half, max(m.center_z for m in members) + half,
+            top, int(np.bincount(regions).argmax()), min(m.time_created for m in members),
+        )
+        return column, (chunk.center_x, chunk.center_z) == anchor
+    def group_changed(self, chunk):
+        '''
+        the anchor of a group draws the column of every chunk in it,
+        so it gets rebuilt when one of them is added, removed or moves
+        '''
+        if chunk.lod < 2:
+            return
+        anchor = self.chunk_map.get(self.lod_group(chunk.center_x, chunk.center_z, chunk.lod)[0])
+        if anchor is not None and anchor is not chunk:
+            self.needs_rebuild.add(anchor)
+    def target_obj_lod(self, chunk):
+        '''
+        distance band of the chunk for its objects, a change means some of them switch level
+        '''
+        return lod_level(
+            self.chunk_distance(chunk),
+            self.OBJECT_LOD_DISTANCES + (self.OBJECT_THIN_DISTANCE,),
+            chunk.obj_lod, self.LOD_HYSTERESIS
+        )
+    def chunk_distance(self, chunk):
+        x, y, z = self.focus_pos
+        return math.sqrt((chunk.center_x-x)**2 + y*y + (chunk.center_z-z)**2)
+    def update_lod(self):
+        '''
+        picks the level of detail of every chunk,
+        chunks whose terrain or objects change their level get rebuilt
+        '''
+        for chunk in self.chunk_list:
+            lod = self.target_lod(chunk)
+            obj_lod = self.target_obj_lod(chunk)
+            if lod != chunk.lod or obj_lod != chunk.obj_lod:
+                chunk.lod = lod
+                chunk.obj_lod = obj_lod
+                self.needs_rebuild.add(chunk)
+    def upload_ready(self):
+        '''
+        uploads meshes finished by the workers, must run on the GL thread
+        '''
+        for chunk, mesh in self.mesh_pool.drain(self.MAX_UPLOADS_PER_FRAME):
+            if not chunk.released:
+                with span("send_gpu", "chunk", x=chunk.center_x, z=chunk.center_z):
+                    chunk.send_gpu(mesh)
+                self.budget.track(chunk, self.frame)
+    def cube_index_buffer(self):
+        '''
+        static index buffer with the cube pattern repeated MAX_CHUNK_BLOCKS times
+        '''
+        if self.cube_ebo is None:
+            indices = cube_indices(MAX_CHUNK_BLOCKS).astype(CUBE_INDEX_TYPE[0])
+            self.cube_ebo = glGenBuffers(1)
+            glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.cube_ebo)
+            glBufferData(GL_ELEMENT_ARRAY_BUFFER, indices.nbytes, indices, GL_STATIC_DRAW)
+        return self.cube_ebo
+    def enforce_budget(self):
+        for chunk in self.budget.evict(self.frame):
+            chunk.free_gpu()
+            self.budget.track(chunk)
+    def stats(self):
+        stats = self.mesh_pool.stats()
+        stats.update(self.budget.stats())
+        if self.occlusion is not None:
+            stats.update(self.occlusion.stats())
+        return stats
+    def close(self):
+        '''
+        stops the workers and frees the GL objects of the world,
+        the GL context has to be current
+        '''
+        self.mesh_pool.shutdown()
+        if self.source is not None and hasattr(self.source, 'close'):
+            self.source.close()
+        # buffers and queries of every chunk, the budget only knows about this world
+        for chunk in self.chunk_list:
+            chunk.free_gpu()
+            self.budget.forget(chunk)
+        if self.occlusion is not None:
+            self.occlusion.delete()
+            self.occlusion = None
+        if self.gpu_timers is not None:
+            self.gpu_timers.delete()
+            self.gpu_timers = None
+        if self.cube_ebo is not None:
+            glDeleteBuffers(1, [self.cube_ebo])
+            self.cube_ebo = None
     def perf_tick(self):
-        if time.perf_counter() - self.last_tick< (1/20):
+        '''
+        step() at most TICK_RATE times per second, for callers without a fixed timestep loop
+        '''
+        if self.clock() - self.last_tick< (1/self.TICK_RATE):
             return
+        self.step()
+        self.last_tick = self.clock()
+    def step(self):
+        '''
+        one simulation tick: chunk animation, LOD and chunk generation
+        meant to run TICK_RATE times per second, independent of the frame rate
+        '''
         self.update()
+        self.update_lod()
+        self.add_loaded()
         self.ticks_elapsed+=1
-        self.last_tick = time.perf_counter()
-        if self.ticks_elapsed%self.rate==0 and len(self.chunk_scheduled)!=0:
+        if self.streaming:
+            self.update_streaming()
+            for _ in range(self.STREAM_CHUNKS_PER_TICK):
+                self.generate_chunk()
+        elif self.ticks_elapsed%self.rate==0 and len(self.chunk_scheduled)!=0:
             self.generate_chunk()
+    def is_idle(self):
+        '''
+        nothing left to generate, animate or upload, and nothing pulsing,
+        so frames would all look the same until the camera moves
+        '''
+        if self.chunk_scheduled or self.loading or self.dynamic_chunks or self.needs_rebuild:
+            return False
+        if self.selected_block is not None:
+            return False
+        now = self.clock()
+        for chunk in self.chunk_list:
+            if chunk.pending or now - chunk.time_created < self.FADE_TIME:
+                return False
+        return True
     def render(self):
         if not self.shader:
             return
             
         self.shader.use()
-        if self.selected_chunk:
-            self.selected_chunk.state = GL_DYNAMIC_DRAW
-            self.selected_chunk.rebuild()
-        if self.prev_selected_chunk:
-            self.prev_selected_chunk.state = GL_STATIC_DRAW
-            self.prev_selected_chunk.rebuild()
-        for chunk in self.dynamic_chunks:
-            chunk.rebuild()
-        for chunk in self.chunk_list:
-            chunk.render(self.shader)
+        self.frame += 1
+        if self.gpu_timers is None:
+            self.gpu_timers = GpuTimers()
+        self.gpu_timers.begin_frame(self.profiler)
+        with self.profiler.phase("rebuild"):
+            # chunks still being meshed stay in the set until their worker is done
+            for chunk in list(self.needs_rebuild):
+                if self.mesh_pool.submit(chunk):
+                    self.needs_rebuild.discard(chunk)
+        with self.profiler.phase("upload"):
+            self.upload_ready()
+        with self.profiler.phase("draw"):
+            self.draw()
         self.shader.stop()
+    def draw(self):
+        '''
+        draws the visible chunks, opaque ones first
+        '''
+        now = self.clock()
+        x, y, z = self.focus_pos
+        opaque = []
+        fading = []
+        for chunk in self.chunk_list:
+            if not self.is_visible(chunk):
+                continue
+            self.budget.touch(chunk, self.frame)
+            if chunk.vao is None:
+                # still waiting for its first mesh, or evicted earlier and brought back
+                if not chunk.pending:
+                    self.mesh_pool.submit(chunk)
+                continue
+            d = (chunk.center_x-x)**2 + (chunk.center_z-z)**2
+            if now - chunk.time_created >= self.FADE_TIME:
+                opaque.append((d, id(chunk), chunk))
+            else:
+                fading.append((d, id(chunk), chunk))
+        # finished chunks front to back without blending, so the depth test
+        # rejects hidden fragments before they are shaded
+        opaque.sort()
+        glDisable(GL_BLEND)
+        gpu = self.gpu_timers
+        with gpu.gpu_pass("terrain"):
+            for _, _, chunk in opaque:
+                chunk.render_terrain()
+        # objects of chunks behind the terrain drawn so far are skipped,
+        # chunks close to the camera are always drawn
+        tested = []
+        if self.OCCLUSION_QUERIES:
+            near = self.CHUNK_RADIUS**2
+            tested = [chunk for d, _, chunk in opaque if chunk.o_i_count and d > near]
+            if self.occlusion is None:
+                self.occlusion = OcclusionCuller(self.cube_index_buffer(), CUBE_INDEX_TYPE[1])
+            self.occlusion.collect(tested)
+            with gpu.gpu_pass("occlusion"):
+                self.occlusion.test(tested)
+            self.shader.use()
+        with gpu.gpu_pass("objects"):
+            for chunk in tested:
+                glBeginConditionalRender(chunk.query, GL_QUERY_NO_WAIT)
+                chunk.render_objects()
+                glEndConditionalRender()
+            tested = set(tested)
+            for _, _, chunk in opaque:
+                if chunk not in tested:
+                    chunk.render_objects()
+        glBindVertexArray(0)
+        # chunks still fading in back to front, blended over everything else
+        fading.sort(reverse=True)
+        glEnable(GL_BLEND)
+        with gpu.gpu_pass("fading"):
+            for _, _, chunk in fading:
+                chunk.render(self.shader)
+        self.enforce_budget()
 # # # # # # #
-    def intersect_check(self, ray_origin, ray_dir, bound_0, bound_max):
-        t_0=(bound_0.data-ray_origin)/ray_dir
-        t_1=(bound_max.data-ray_origin)/ray_dir
-        t_0=Vector3D(t_0[0], t_0[1],t_0[2])
-        t_1=Vector3D(t_1[0], t_1[1],t_1[2])
-
-        t_min = np.minimum(t_0.data, t_1.data)
-        t_max = np.maximum(t_0.data, t_1.data)
-
-        t_enter = np.max(t_min)
-        t_exit = np.min(t_max)
-        if t_enter > t_exit or t_exit < 0:
-            return False, None
-        return True,t_enter
+    def block_at(self, i, j):
+        '''
+        (chunk, block id) of the block in grid cell (i, j), the block centered at (2i, 2j)
+        '''
+        # chunks are 3x3 blocks centered on multiples of 3 cells
+        ci, cj = (i+1)//3, (j+1)//3
+        chunk = self.chunk_map.get((ci*3*BLOCK_SIZE, cj*3*BLOCK_SIZE))
+        if chunk is None:
+            return None, None
+        return chunk, chunk.block_start + (i-3*ci+1)*3 + (j-3*cj+1)
+    def pick_block(self, ray_origin, ray_dir, max_dist=PICK_DISTANCE):
+        '''
+        walks the block grid along the ray (2D DDA) and returns (chunk, block id, t)
+        of the first column the ray hits, or (None, None, None)
+        only the cells under the ray are visited, so it is cheap enough for hovering
+        chunks drawn at lod > 0 are hit at the height of their column, like they look
+        '''
+        store = self.store
+        tops = {} # chunk => height of its column, for chunks with lod > 0
+        ox, oy, oz = float(ray_origin[0]), float(ray_origin[1]), float(ray_origin[2])
+        dx, dy, dz = float(ray_dir[0]), float(ray_dir[1]), float(ray_dir[2])
+        # cell (i, j) covers [2i-1, 2i+1] x [2j-1, 2j+1]
+        half = BLOCK_SIZE/2
+        i = math.floor((ox+half)/BLOCK_SIZE)
+        j = math.floor((oz+half)/BLOCK_SIZE)
+        step_i = 1 if dx > 0 else -1
+        step_j = 1 if dz > 0 else -1
+        inf = float('inf')
+        # ray distance between two x (z) cell borders, and to the first one
+        delta_i = abs(BLOCK_SIZE/dx) if dx != 0 else inf
+        delta_j = abs(BLOCK_SIZE/dz) if dz != 0 else inf
+        next_i = ((i*BLOCK_SIZE + step_i*half) - ox)/dx if dx != 0 else inf
+        next_j = ((j*BLOCK_SIZE + step_j*half) - oz)/dz if dz != 0 else inf
+        t_enter = 0.0
+        while t_enter <= max_dist:
+            t_exit = min(next_i, next_j)
+            chunk, block = self.block_at(i, j)
+            if chunk is not None:
+                if chunk.lod == 0:
+                    h = float(store.y[block]) - chunk.k
+                else:
+                    h = tops.get(chunk)
+                    if h is None:
+                        h = tops[chunk] = self.column_top(chunk)
+                # part of the ray with 0 <= y <= h
+                if dy != 0:
+                    lo, hi = sorted(((0-oy)/dy, (h-oy)/dy))
+                elif 0 <= oy <= h:
+                    lo, hi = -inf, inf
+                else:
+                    lo, hi = inf, -inf
+                t_hit = max(t_enter, lo)
+                if t_hit <= min(t_exit, hi):
+                    return chunk, block, t_hit
+            y = oy + dy*t_exit
+            if (dy >= 0 and y > store.max_y) or (dy <= 0 and y < 0):
+                break # above the highest block going up, or under the ground
+            if next_i < next_j:
+                i += step_i
+                next_i += delta_i
+            else:
+                j += step_j
+                next_j += delta_j
+            t_enter = t_exit
+        return None, None, None
+    def column_top(self, chunk):
+        '''
+        height of the column a chunk with lod > 0 is drawn as
+        '''
+        if chunk.lod >= 2:
+            return self.group_column(chunk)[0][4]
+        return float(self.store.y[chunk.block_start:chunk.block_stop].max()) - chunk.k
     def select_block(self, ray_origin, ray_dir):
         temp = None
         if self.selected_chunk:
             temp = self.selected_chunk
         print(f"casting ray <{ray_origin} in dir: {ray_dir}>")
-        closest_b,closest_c,closest_t=None,None,float('inf')
-        for chunk in self.chunk_list:
-            k = chunk.k
-            for block in chunk.blocks:
-                bound_0=Vector3D(block.center_x-1,0,block.center_z-1)
-                bound_max=Vector3D(block.center_x+1,block.y-k,block.center_z+1)
-                hit_occured,t_hit=self.intersect_check(ray_origin,ray_dir,bound_0,bound_max)
-                if hit_occured and t_hit<closest_t:
-                    closest_t,closest_b=t_hit,block
-                    closest_c = chunk
+        store = self.store
+        closest_c,closest_b,_=self.pick_block(ray_origin,ray_dir)
         if closest_b is not None:
-            print(f'selected block at {closest_b.center_x}, {closest_b.curr_y}, {closest_b.center_z}')
-            print(f'region of the block: {closest_b.region}')
-            print(f'has object: {closest_b.obj is not None}')
+            print(f'selected block at {store.center_x[closest_b]}, {store.curr_y[closest_b]}, {store.center_z[closest_b]}')
+            print(f'region of the block: {store.get_region(closest_b)}')
+            print(f'has object: {store.get_object(closest_b) is not None}')
             self.selected_chunk = closest_c
             self.selected_block = closest_b
             if temp:
@@ -372,3 +1055,11 @@ class World:
                 self.selected_block = None
                 if temp:
                     self.prev_selected_chunk = temp
+        self.mark_selection_dirty()
+    def mark_selection_dirty(self):
+        if self.selected_chunk:
+            self.selected_chunk.state = GL_DYNAMIC_DRAW
+            self.needs_rebuild.add(self.selected_chunk)
+        if self.prev_selected_chunk and self.prev_selected_chunk is not self.selected_chunk:
+            self.prev_selected_chunk.state = GL_STATIC_DRAW
+            self.needs_rebuild.add(self.prev_selected_chunk)
@@ -0,0 +1,8 @@
+#version 450 core
+
+// only used for occlusion queries, colour writes are off
+out vec4 FragColor;
+
+void main() {
+    FragColor = vec4(1.0);
+}
@@ -0,0 +1,17 @@
+#version 450 core
+
+// unit cube corners, x and z in [-1, 1], y in [0, 1]
+layout(location = 0) in vec3 aPos;
+
+layout(std140, binding = 0) uniform Frame {
+    mat4 view;
+    mat4 projection;
+    float time;
+};
+// center x, center z, half width, height
+uniform vec4 box;
+
+void main() {
+    vec3 pos = vec3(box.x + aPos.x * box.z, aPos.y * box.w, box.y + aPos.z * box.z);
+    gl_Position = projection * view * vec4(pos, 1.0);
+}
@@ -11,16 +11,18 @@ out float yLevel;
 out float dTime;
 out float cTime;
 
-uniform mat4 model;
-uniform mat4 view;
-uniform mat4 projection;
-uniform float time;
+// filled once per frame by render.shader.FrameUniforms
+layout(std140, binding = 0) uniform Frame {
+    mat4 view;
+    mat4 projection;
+    float time;
+};
 
 void main() {
     yLevel = blockY;
     vRegion = aRegion;
     isSelected = aSelected;
-    gl_Position = projection * view * model * vec4(aPos, 1.0);
+    gl_Position = projection * view * vec4(aPos, 1.0);
     dTime = time - aTimeCreated;
     cTime = time;
 }
@@ -0,0 +1,55 @@
+'''
+Background world generation
+'''
+from PyQt5.QtCore import QThread, pyqtSignal
+
+from core.generation import generate_world, GenerationCancelled
+from core.tracing import span
+
+import threading
+
+class GenerationWorker(QThread):
+    '''
+    runs the generation pipeline off the GUI thread
+
+    the finished data is emitted back with the generation id, so the
+    receiver can drop results of generations that were replaced
+    '''
+    progress = pyqtSignal(int, str, int, int) # gen_id, stage, n_done, n_total
+    generated = pyqtSignal(int, object) # gen_id, (rg_info, y_info, obj_info)
+    failed = pyqtSignal(int, str)
+
+    def __init__(self, gen_id, seed, rings, obj_intensity, height_intensity):
+        super().__init__()
+        self.gen_id = gen_id
+        self.seed = seed
+        self.rings = rings
+        self.obj_intensity = obj_intensity
+        self.height_intensity = height_intensity
+
+    def cancel(self):
+        self.requestInterruption()
+
+    def checkpoint(self):
+        if self.isInterruptionRequested():
+            raise GenerationCancelled()
+
+    def report(self, stage, n_done, n_total):
+        self.progress.emit(self.gen_id, stage, n_done, n_total)
+
+    def run(self):
+        # qt threads show up as Dummy-N otherwise, also names the track in traces
+        threading.current_thread().name = f"generation-{self.gen_id}"
+        try:
+            with span("generate_world", "generation", gen_id=self.gen_id, seed=self.seed, rings=self.rings):
+                data = generate_world(
+                    self.seed, self.rings, self.obj_intensity, self.height_intensity,
+                    progress=self.report, checkpoint=self.checkpoint
+                )
+        except GenerationCancelled:
+            return
+        except Exception as e:
+            self.failed.emit(self.gen_id, str(e))
+            return
+        if not self.isInterruptionRequested():
+            self.generated.emit(self.gen_id, data)
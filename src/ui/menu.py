@@ -8,14 +8,18 @@ from OpenGL.GL import *
 from OpenGL.GLU import *
 
 from core.camera import Camera
+from core.fixed_step import FixedStep
+from core.flythrough import FlightRecorder
 from core.enums import WindowState, CameraState
 from core.matrix_util import Vector3D,Vector4D,Matrix3D,Matrix4D
-from core.region_gen import init_regions
-from core.object_gen import init_objects
-from core.terrain_gen import init_heights
-from render.shader import Shader
-from render.world_manager import World
+from render.shader import Shader, FrameUniforms
+from render.palette import Palette
+from render.frame_profiler import FrameProfiler
+from render.world_manager import World, init_gl_state
 from ui.interactable import MenuToConfigButton, Button, InteractableSlider
+from ui.generation_worker import GenerationWorker
+from core.generation import default_pipeline
+from core.chunk_source import ProceduralSource
 
 import random
 import time
@@ -72,6 +76,10 @@ class GenerationViewWidget(QOpenGLWidget):
     gen_complete_signal = pyqtSignal(
         bool
     )
+    gen_progress_signal = pyqtSignal(
+        str,int,int
+    )
+    wake_signal = pyqtSignal()
     def __init__(self, main_window, seed=1, fps=144):
         super().__init__()
         self.main_window = main_window
@@ -89,6 +97,28 @@ class GenerationViewWidget(QOpenGLWidget):
         self.frame_count=0
 
         self.shader = None
+        self.frame_uniforms = None
+        self.palette = None
+        self.world = None
+        self.recorder = None # FlightRecorder while a flythrough is recorded
+
+        # frames are only drawn when something changed, alpha is how far the
+        # simulation clock is between the last two camera steps
+        self.dirty = True
+        self.alpha = 1.0
+
+        # frame phase timing, on while the overlay is shown (F3), F4 exports the log
+        self.profiler = FrameProfiler(enabled=False)
+        self.overlay = QLabel(self)
+        self.overlay.setStyleSheet("background: rgba(0, 0, 0, 150); color: white; font-family: monospace; padding: 4px;")
+        self.overlay.move(8, 8)
+        self.overlay.hide()
+        self.frameSwapped.connect(lambda: self.profiler.stop("swap"))
+
+        # background generation
+        self.gen_id = 0
+        self.gen_params = None
+        self.gen_workers = []
 
 
         apply_styles(self)
@@ -98,33 +128,145 @@ class GenerationViewWidget(QOpenGLWidget):
         elapsed = current_time - self.last_time
         fps = self.frame_count / elapsed if elapsed > 0 else 0.0
         print(f"fps: {fps:.2f}")
+        if self.world is not None:
+            stats = self.world.stats()
+            print(f"mesh queue: {stats['queued']} queued, {stats['ready']} ready; build: {stats['avg_build_ms']:.2f}ms avg, {stats['max_build_ms']:.2f}ms max; wait: {stats['avg_wait_ms']:.2f}ms")
+            print(f"memory: {stats['chunks']} chunks, cpu {stats['cpu_bytes']/2**20:.1f}MiB, gpu {stats['gpu_bytes']/2**20:.1f}/{stats['gpu_limit']/2**20:.0f}MiB, {stats['evictions']} evictions")
+            if 'occluded' in stats:
+                print(f"occlusion: {stats['occluded']}/{stats['occlusion_tested']} chunks hidden, {stats['occlusion_queries']} queries")
         self.frame_count = 0
         self.last_time = current_time
-    
-    def trigger_generation(self,seed=1,obj_intensity=0.05,rings=6,generation_rate=5,height_intensity=0.3):
+
+    def close_world(self):
+        '''
+        closes the current world with the GL context current, so its buffers,
+        queries and programs can be freed
+        '''
+        if self.world is None:
+            return
+        self.makeCurrent()
+        try:
+            self.world.close()
+        finally:
+            self.doneCurrent()
         self.world = None
+
+    def request_frame(self):
+        '''
+        something changed outside of the simulation, draw it and resume ticking
+        '''
+        self.dirty = True
+        self.wake_signal.emit()
+    
+    def trigger_generation(self,seed=1,obj_intensity=0.05,rings=6,generation_rate=5,height_intensity=0.3,streaming=False):
+        '''
+        starts generating a new world in the background,
+        a generation that is still running gets cancelled
+        streaming worlds are generated chunk by chunk around the camera instead
+        '''
         self.seed=seed
         print('generation triggered')
-        
-        rg_info=init_regions(seed,rings)
-        y_info=init_heights(seed,rings,height_intensity,rg_info)
-        obj_info=init_objects(seed,rings,obj_intensity,rg_info,y_info)
+        for worker in self.gen_workers:
+            worker.cancel()
+        self.gen_id += 1
+        self.gen_params = dict(
+            seed=seed,n_rings=rings,obj_intensity=obj_intensity,height_intensity=height_intensity,generation_rate=generation_rate
+        )
+        if streaming:
+            self.close_world()
+            self.world = World(
+                {},{},{},shader=self.shader,streaming=True,
+                source=ProceduralSource(seed,obj_intensity,height_intensity),**self.gen_params
+            )
+            self.request_frame()
+            self.gen_complete_signal.emit(False)
+            return
 
+        worker = GenerationWorker(self.gen_id,seed,rings,obj_intensity,height_intensity)
+        worker.progress.connect(self.on_generation_progress)
+        worker.generated.connect(self.on_generation_done)
+        worker.failed.connect(self.on_generation_failed)
+        worker.finished.connect(lambda: self.gen_workers.remove(worker))
+        self.gen_workers.append(worker)
+        worker.start()
+
+    def on_generation_progress(self, gen_id, stage, n_done, n_total):
+        if gen_id != self.gen_id:
+            return
+        self.gen_progress_signal.emit(stage, n_done, n_total)
+
+    def on_generation_done(self, gen_id, data):
+        # runs on the GUI thread, which owns the GL context
+        if gen_id != self.gen_id:
+            return
+        rg_info,y_info,obj_info = data
+        self.close_world()
         self.world = World(
-            y_info,rg_info,obj_info,seed,self.shader,n_rings=rings,obj_intensity=obj_intensity,height_intensity=height_intensity,generation_rate=generation_rate
+            y_info,rg_info,obj_info,shader=self.shader,**self.gen_params
         )
         self.world.generate_mesh()
+        self.request_frame()
+        stats = default_pipeline.stats()
+        print(f"stage cache: {stats['hits']} hits, {stats['misses']} misses ({100*stats['hit_rate']:.0f}%)")
 
         self.gen_complete_signal.emit(False) # false enables widget, true disables it
 
+    def save_world(self, path):
+        if self.world is None:
+            return
+        try:
+            self.world.save(path)
+            print(f'world saved to {path}')
+        except (OSError, ValueError) as e:
+            print('could not save world: ',e)
+
+    def load_world(self, path):
+        '''
+        replaces the current world with one read from a world file
+        '''
+        for worker in self.gen_workers:
+            worker.cancel()
+        self.gen_id += 1
+        try:
+            world = World.from_file(path,shader=self.shader,streaming=True)
+        except (OSError, ValueError) as e:
+            print('could not load world: ',e)
+            return
+        self.close_world()
+        self.world = world
+        self.seed = world.seed
+        # only the chunks around the camera are read, more follow as it moves
+        self.world.set_focus(self.camera.pos)
+        self.request_frame()
+        self.gen_complete_signal.emit(False)
+
+    def import_heightmap(self, path):
+        '''
+        replaces the current world with one built on a heightmap file
+        '''
+        for worker in self.gen_workers:
+            worker.cancel()
+        self.gen_id += 1
+        obj_intensity = self.gen_params['obj_intensity'] if self.gen_params else 0.05
+        try:
+            world = World.from_heightmap(path,shader=self.shader,seed=self.seed,obj_intensity=obj_intensity)
+        except (OSError, ValueError) as e:
+            print('could not import heightmap: ',e)
+            return
+        self.close_world()
+        self.world = world
+        self.world.generate_mesh()
+        self.request_frame()
+        self.gen_complete_signal.emit(False)
+
+    def on_generation_failed(self, gen_id, message):
+        if gen_id != self.gen_id:
+            return
+        print('world generation went wrong: ',message)
+        self.gen_complete_signal.emit(False)
+
     def initializeGL(self):
-        glClearColor(0.4, 0.7, 1.0, 1.0) #temp color
-        glEnable(GL_CULL_FACE)
-        glEnable(GL_BLEND)
-        glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
-        glFrontFace(GL_CCW)
-        glCullFace(GL_BACK)
-        glEnable(GL_DEPTH_TEST)
+        init_gl_state()
         print('starting to generate world')
         try:
             self.shader = Shader(
@@ -140,10 +282,8 @@ class GenerationViewWidget(QOpenGLWidget):
                             "shaders","world_f.frag"
                         )
                         ))
-            self.shader.use()
-            self.shader.set_mat4('projection',self.camera.proj_matr(self.width(),self.height()))
-            self.shader.set_mat4('view',self.camera.view_matr())
-            self.shader.set_float('time',time.perf_counter())
+            self.frame_uniforms = FrameUniforms()
+            self.palette = Palette()
         except Exception as e:
             print('shader init went wrong: ',e)
         try:
@@ -159,13 +299,37 @@ class GenerationViewWidget(QOpenGLWidget):
         # glLoadIdentity()
         # self.camera.apply(self.width(), self.height())
         try:
-            self.shader.use()
-            self.shader.set_mat4('projection',self.camera.proj_matr(self.width(),self.height()))
-            self.shader.set_mat4('view',self.camera.view_matr())
-            self.world.render()
-            self.world.perf_tick()
+            self.palette.bind()
+            self.frame_uniforms.update(
+                self.camera.view_matr(self.alpha),self.camera.proj_matr(self.width(),self.height(),self.alpha),
+                self.world.clock() if self.world is not None else time.perf_counter()
+            )
+            if self.world is not None:
+                self.world.profiler = self.profiler # worlds get replaced, keep them on the widget's profiler
+                self.world.set_focus(self.camera.pos,self.camera.get_dir(),self.camera.fov,self.width()/max(1,self.height()))
+                self.world.render()
         except Exception as e:
             print('OpenGL render error: ',e)
+        # until frameSwapped
+        self.profiler.start("swap")
+        if self.overlay.isVisible() and self.frame_count % 15 == 0:
+            self.overlay.setText(self.profiler.overlay_text())
+            self.overlay.adjustSize()
+    def toggle_overlay(self):
+        enabled = not self.overlay.isVisible()
+        self.profiler.set_enabled(enabled)
+        self.overlay.setVisible(enabled)
+        self.request_frame()
+    def export_frame_log(self):
+        if not self.profiler.log:
+            print('no frames timed yet, press F3 to start timing')
+            return
+        path = os.path.abspath(f"frame_log_{time.strftime('%Y%m%d_%H%M%S')}.csv")
+        try:
+            self.profiler.export(path)
+            print(f'{len(self.profiler.log)} frames exported to {path}')
+        except OSError as e:
+            print('could not export frame log: ',e)
     # Input events
     def mousePressEvent(self, event):
         if self.mouse_locked:
@@ -188,6 +352,7 @@ class GenerationViewWidget(QOpenGLWidget):
             ray_world = inv_view @ ray_eye
             ray_dir = Vector3D(ray_world[0], ray_world[1], ray_world[2]).normalize()
             self.world.select_block(ray_origin.data,ray_dir.data)
+            self.request_frame()
         if event.button() == Qt.RightButton:
             self.setMouseTracking(True)
             self.mouse_locked = True
@@ -213,7 +378,28 @@ class GenerationViewWidget(QOpenGLWidget):
         dx = event.globalX() - center.x()
         dy = event.globalY() - center.y()
         self.camera.rotate(dx, -dy)
+        if self.recorder is not None:
+            self.recorder.rotate(dx, -dy)
         QCursor.setPos(center)
+        self.request_frame()
+
+    def toggle_recording(self, timestep):
+        '''
+        starts or stops recording a flythrough, replay it with
+            py -m render.headless --flight <file>
+        '''
+        if self.recorder is None:
+            params = self.gen_params or {}
+            self.recorder = FlightRecorder(self.camera,timestep,params.get('seed'),params.get('n_rings'))
+            print('recording flythrough (F9 to stop)')
+            return
+        path = os.path.abspath(f"flight_{time.strftime('%Y%m%d_%H%M%S')}.json")
+        try:
+            self.recorder.save(path)
+            print(f'flythrough of {self.recorder.steps} steps saved to {path}')
+        except OSError as e:
+            print('could not save flythrough: ',e)
+        self.recorder = None
 
     def showEvent(self, event):
         if self.mouse_locked:
@@ -232,8 +418,11 @@ class GenerationConfigWidget(QWidget):
 
 class GenerationSidebar(QWidget):
     gen_signal = pyqtSignal(
-        int,float,int,int,float
+        int,float,int,int,float,bool
     )
+    save_signal = pyqtSignal(str)
+    load_signal = pyqtSignal(str)
+    heightmap_signal = pyqtSignal(str)
 
     def __init__(self, main_window):
         super().__init__()
@@ -265,9 +454,27 @@ class GenerationSidebar(QWidget):
         self.parameters_layout.addWidget(self.generation_rate)
         self.parameters_layout.addWidget(self.height_intensity)
         self.parameters_layout.setAlignment(Qt.AlignCenter)
+        self.streaming_box = QCheckBox("Infinite world")
+
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setTextVisible(True)
+        self.progress_bar.hide()
+
         self.seed_generate.addWidget(self.input_field)
         self.seed_generate.addWidget(self.seed_input)
+        self.seed_generate.addWidget(self.streaming_box)
         self.seed_generate.addWidget(self.generate_button)
+        self.seed_generate.addWidget(self.progress_bar)
+
+        self.save_button = Button("Save World", self.save_action)
+        self.save_button.setCursor(Qt.PointingHandCursor)
+        self.load_button = Button("Load World", self.load_action)
+        self.load_button.setCursor(Qt.PointingHandCursor)
+        self.heightmap_button = Button("Import Heightmap", self.heightmap_action)
+        self.heightmap_button.setCursor(Qt.PointingHandCursor)
+        self.seed_generate.addWidget(self.save_button)
+        self.seed_generate.addWidget(self.load_button)
+        self.seed_generate.addWidget(self.heightmap_button)
 
         self.main_layout.addWidget(self.title)
         self.main_layout.addWidget(self.parameters_widget)
@@ -277,7 +484,29 @@ class GenerationSidebar(QWidget):
         #cosmetichka
         apply_styles(self)
     def set_generating(self,flag):
-        self.generate_button.setEnabled(not flag)
+        # the button stays enabled, pressing it again restarts the generation
+        self.progress_bar.setVisible(flag)
+        if flag:
+            self.progress_bar.setValue(0)
+            self.progress_bar.setFormat("generating...")
+    def set_progress(self,stage,n_done,n_total):
+        self.progress_bar.show()
+        self.progress_bar.setValue(100*n_done//n_total)
+        self.progress_bar.setFormat(f"{stage} ({n_done}/{n_total})")
+    def save_action(self):
+        path, _ = QFileDialog.getSaveFileName(self, "Save World", "world.fsmw", "World files (*.fsmw)")
+        if path:
+            self.save_signal.emit(path)
+    def load_action(self):
+        path, _ = QFileDialog.getOpenFileName(self, "Load World", "", "World files (*.fsmw)")
+        if path:
+            self.load_signal.emit(path)
+    def heightmap_action(self):
+        path, _ = QFileDialog.getOpenFileName(
+            self, "Import Heightmap", "", "Heightmaps (*.npy *.raw *.r16 *.r32 *.f32)"
+        )
+        if path:
+            self.heightmap_signal.emit(path)
     def generate_action(self):
         try:
             seed_inp = self.seed_input.text()
@@ -286,9 +515,10 @@ class GenerationSidebar(QWidget):
             rings = int(self.rings.display.toPlainText())
             generation_rate = int(self.generation_rate.display.toPlainText())
             height_intensity = float(self.height_intensity.display.toPlainText())
-            self.set_generating(True)
+            streaming = self.streaming_box.isChecked()
+            self.set_generating(not streaming)
             self.gen_signal.emit(
-                seed,obj_intensity,rings,generation_rate,height_intensity
+                seed,obj_intensity,rings,generation_rate,height_intensity,streaming
             )
             print(f"generation started;\nseed: {seed}\nsize:{3^rings}\no_i:{obj_intensity}\ng_r:{generation_rate}\nh_i:{height_intensity}")
         except ValueError:
@@ -300,6 +530,11 @@ class GenerationSidebar(QWidget):
             print("Invalid seed value.")
 
 class MainInterface(QWidget):
+    '''
+    runs the simulation: camera steps at fps and world ticks at World.TICK_RATE,
+    both on fixed timesteps. Frames are requested only while something moves,
+    the timer stops once the camera is still and the world is idle
+    '''
     def __init__(self, main_window, fps=144):
         super().__init__()
         self.main_window = main_window
@@ -317,24 +552,74 @@ class MainInterface(QWidget):
         self.main_layout.addWidget(self.splitter)
         self.setLayout(self.main_layout)
 
+        self.fps = fps
+        self.camera_loop = FixedStep(1/fps)
+        self.world_loop = FixedStep(1/World.TICK_RATE)
         self.timer = QTimer()
+        self.timer.setTimerType(Qt.PreciseTimer)
         self.timer.timeout.connect(self.update_w)
-        self.timer.start(1000//fps)
+        self.wake()
 
         self.sidebar.gen_signal.connect(self.generator_view.trigger_generation)
         self.generator_view.gen_complete_signal.connect(self.sidebar.set_generating)
+        self.generator_view.gen_progress_signal.connect(self.sidebar.set_progress)
+        self.sidebar.save_signal.connect(self.generator_view.save_world)
+        self.sidebar.load_signal.connect(self.generator_view.load_world)
+        self.sidebar.heightmap_signal.connect(self.generator_view.import_heightmap)
+        self.generator_view.wake_signal.connect(self.wake)
+
+    def wake(self):
+        '''
+        resumes ticking after being idle, the idle time is not simulated
+        '''
+        if self.timer.isActive():
+            return
+        self.camera_loop.reset()
+        self.world_loop.reset()
+        self.timer.start(1000//self.fps)
 
     def update_w(self):
-        if Qt.Key_C in self.generator_view.camera.active_keys:
-            # FIXME - after you zoom in once, this function gets called indefinitely
-            self.generator_view.camera.zoom()
-        if self.generator_view.camera.state==CameraState.DEFAULT:
-            self.generator_view.camera.move()
-        self.generator_view.update()
+        view = self.generator_view
+        profiler = view.profiler
+        profiler.next_frame()
+        moved = False
+        with profiler.phase("camera"):
+            for _ in range(self.camera_loop.advance()):
+                moved = view.camera.step() or moved
+                if view.recorder is not None:
+                    view.recorder.step()
+        ticks = self.world_loop.advance()
+        if view.world is not None and ticks:
+            with profiler.phase("perf_tick"):
+                for _ in range(ticks):
+                    view.world.step()
+        view.alpha = self.camera_loop.alpha
+        if view.dirty or moved or not view.camera.is_still() or view.recorder is not None \
+           or (view.world is not None and not view.world.is_idle()):
+            view.dirty = False
+            view.update()
+            return
+        # nothing will change until the next input, draw the camera where it
+        # stopped and let the event loop sleep
+        view.alpha = 1.0
+        view.update()
+        self.timer.stop()
 
    
     def keyPressEvent(self, event):
-        self.generator_view.camera.set_key(event.nativeVirtualKey(), True)
+        self.wake()
+        if event.key() == Qt.Key_F9:
+            self.generator_view.toggle_recording(self.camera_loop.step)
+            return
+        if event.key() == Qt.Key_F3:
+            self.generator_view.toggle_overlay()
+            return
+        if event.key() == Qt.Key_F4:
+            self.generator_view.export_frame_log()
+            return
+        self.generator_view.camera.press(event.nativeVirtualKey(), True)
+        if self.generator_view.recorder is not None:
+            self.generator_view.recorder.key(event.nativeVirtualKey(), True)
         match event.nativeVirtualKey():
             # case Qt.Key_Escape:
             #     self.generator_view.mouse_locked = not self.generator_view.mouse_locked
@@ -342,15 +627,16 @@ class MainInterface(QWidget):
             #     self.generator_view.setCursor(Qt.BlankCursor if self.generator_view.mouse_locked else Qt.ArrowCursor)
             #     if self.generator_view.mouse_locked:
             #         QCursor.setPos(self.mapToGlobal(self.rect().center()))
-            case 67:
-                self.generator_view.camera.state = CameraState.ZOOM
             case _:
                 return
     
     def keyReleaseEvent(self, event):
-        self.generator_view.camera.set_key(event.nativeVirtualKey(), False)
-        if event.nativeVirtualKey()==67:
-            self.generator_view.camera.state = CameraState.DEFAULT
+        if event.key() in (Qt.Key_F9, Qt.Key_F3, Qt.Key_F4):
+            return
+        self.wake()
+        self.generator_view.camera.press(event.nativeVirtualKey(), False)
+        if self.generator_view.recorder is not None:
+            self.generator_view.recorder.key(event.nativeVirtualKey(), False)
 
   
 class Window(QMainWindow):
@@ -0,0 +1,28 @@
+'''
+opening raw heightmaps
+'''
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import numpy as np
+import pytest
+
+from core.heightmap import Heightmap
+
+def test_raw_square(tmp_path):
+    path = str(tmp_path / "map.r16")
+    np.arange(16*16, dtype="<u2").tofile(path)
+    heightmap = Heightmap.open(path)
+    assert heightmap.data.shape == (16, 16)
+    assert heightmap.data[1, 0] == 16
+
+def test_raw_not_square(tmp_path):
+    path = str(tmp_path / "map.r16")
+    np.zeros(16*20, dtype="<u2").tofile(path)
+    with pytest.raises(ValueError):
+        Heightmap.open(path)
+    assert Heightmap.open(path, shape=(16, 20)).data.shape == (16, 20)
+    with pytest.raises(ValueError):
+        Heightmap.open(path, shape=(16, 16))
@@ -0,0 +1,38 @@
+'''
+a world stored in the disk cache reads back the same, block by block
+'''
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import pytest
+
+from core.region_gen import init_regions
+from core.terrain_gen import init_heights
+from core.object_gen import init_objects
+from core.world_cache import WorldCache
+from core.world_file import chunk_centers, chunk_blocks
+
+SEED = 5
+RINGS = 3
+
+def test_store_load(tmp_path):
+    rg_info = init_regions(SEED, RINGS)
+    y_info = init_heights(SEED, RINGS, 0.3, rg_info)
+    obj_info = init_objects(SEED, RINGS, 0.2, rg_info, y_info)
+
+    cache = WorldCache(str(tmp_path))
+    key = cache.key(SEED, RINGS, 0.2, 0.3, 1)
+    assert cache.load(key, RINGS) is None
+    cache.store(key, RINGS, rg_info, y_info, obj_info)
+    rg_view, y_view, obj_view = cache.load(key, RINGS)
+    for c in chunk_centers(RINGS):
+        for block in chunk_blocks(*c):
+            assert rg_view[block] == rg_info[block]
+            # heights are stored as float32
+            assert y_view[block] == pytest.approx(y_info[block], rel=1e-6)
+            assert obj_view[block] == obj_info[block]
+    # a world of another size does not fit the stored grids
+    assert cache.load(key, RINGS+1) is None
+    assert cache.stats() == {'hits': 1, 'misses': 2}
@@ -0,0 +1,50 @@
+'''
+round trip of the binary world file: save a generated world, read it back
+chunk by chunk and compare the grids
+'''
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import pytest
+
+from core.region_gen import init_regions
+from core.terrain_gen import init_heights
+from core.object_gen import init_objects
+from core.world_file import WorldFile, save_world, chunk_centers, chunk_blocks
+
+SEED = 3
+RINGS = 3
+
+@pytest.fixture(scope="module")
+def world():
+    rg_info = init_regions(SEED, RINGS)
+    y_info = init_heights(SEED, RINGS, 0.3, rg_info)
+    obj_info = init_objects(SEED, RINGS, 0.2, rg_info, y_info)
+    return rg_info, y_info, obj_info
+
+@pytest.mark.parametrize("compress", [True, False])
+def test_round_trip(tmp_path, world, compress):
+    rg_info, y_info, obj_info = world
+    path = str(tmp_path / "world.fsmw")
+    save_world(path, SEED, RINGS, 0.2, 0.3, rg_info, y_info, obj_info, compress=compress)
+
+    world_file = WorldFile(path)
+    try:
+        assert world_file.seed == SEED
+        assert world_file.n_rings == RINGS
+        assert world_file.obj_intensity == pytest.approx(0.2)
+        assert world_file.height_intensity == pytest.approx(0.3)
+        assert sorted(world_file.index) == sorted(chunk_centers(RINGS))
+        for cx, cz in chunk_centers(RINGS):
+            assert world_file.has_chunk(cx, cz)
+            y_data, rg_data, obj_data = world_file.chunk_data(cx, cz)
+            for block in chunk_blocks(cx, cz):
+                assert rg_data[block] == rg_info[block]
+                assert obj_data[block] == obj_info[block]
+                # heights are quantized to 16 bits over the height range
+                assert y_data[block] == pytest.approx(y_info[block], abs=world_file.h_scale)
+        assert not world_file.has_chunk(6*RINGS, 0)
+    finally:
+        world_file.close()